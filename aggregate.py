@@ -0,0 +1,161 @@
+import numpy as np
+import pandas as pd
+
+# ---------------- aggregation engine ----------------
+# Every breakdown in build_report is a count, a distinct-count or a max over a
+# few categorical columns. Instead of re-filtering the frame and running a
+# pandas groupby per breakdown, the columns are factorized into integer codes
+# once and each breakdown becomes a bincount/unique over combined int keys.
+
+# key spaces up to this size are grouped with bincount, larger ones by sorting
+DENSE_LIMIT = 1 << 22
+
+
+class Encoded:
+    """Integer codes for a column (-1 = missing) and its sorted unique values."""
+
+    __slots__ = ("codes", "uniques", "labels")
+
+    def __init__(self, codes, uniques):
+        self.codes = np.asarray(codes, dtype=np.int64)
+        self.uniques = list(uniques)
+        self.labels = [str(u) for u in self.uniques]
+
+    def __len__(self) -> int:
+        return len(self.uniques)
+
+    def valid(self) -> np.ndarray:
+        return self.codes >= 0
+
+
+def encode(values) -> Encoded:
+    if isinstance(getattr(values, "dtype", None), pd.CategoricalDtype):
+        # normalized columns are already interned: reuse their codes
+        cat = values.cat.remove_unused_categories()
+        if cat.cat.categories.is_monotonic_increasing:
+            return Encoded(cat.cat.codes.to_numpy(), cat.cat.categories)
+    # sort=True gives the same key order as groupby(sort=True)
+    codes, uniques = pd.factorize(values, sort=True)
+    return Encoded(codes, uniques)
+
+
+def relabel(enc: Encoded, fn) -> Encoded:
+    """Map every unique value through fn, merging values that collide."""
+    if not len(enc):
+        return Encoded(enc.codes.copy(), [])
+    mapped = pd.Series([fn(u) for u in enc.uniques], dtype=object)
+    new_codes, new_uniques = pd.factorize(mapped, sort=True)
+    codes = np.where(enc.codes >= 0, new_codes[np.maximum(enc.codes, 0)], -1)
+    return Encoded(codes, new_uniques)
+
+
+class Groups:
+    """Observed key combinations of some code arrays, in sorted key order.
+
+    `keys[i]` holds the i-th key code of every group and `inverse` the group of
+    every selected row, so reductions are a single bincount over `inverse`.
+    Rows with a missing (-1) code are skipped, unless `missing` is set, in
+    which case -1 is a key of its own.
+    """
+
+    def __init__(self, codes: list, dims: list, mask=None, missing: bool = False):
+        shift = 1 if missing else 0  # with missing, -1 is grouped as code 0
+        n = len(codes[0]) if codes else 0
+        sel = np.ones(n, dtype=bool) if mask is None else np.asarray(mask, dtype=bool).copy()
+        if not missing:
+            for c in codes:
+                sel &= c >= 0
+        self.rows = sel
+        self.dims = [int(d) for d in dims]
+        shape = [d + shift for d in self.dims]
+        space = int(np.prod(shape, dtype=np.float64)) if shape else 0
+
+        if not sel.any() or space == 0:
+            self.keys = [np.empty(0, dtype=np.int64) for _ in codes]
+            self.inverse = np.empty(0, dtype=np.int64)
+            self.n = 0
+            return
+
+        flat = np.ravel_multi_index(tuple(c[sel] + shift for c in codes), shape)
+        if space <= DENSE_LIMIT:
+            present = np.bincount(flat, minlength=space) > 0
+            gflat = np.flatnonzero(present)
+            self.inverse = (np.cumsum(present) - 1)[flat]
+        else:
+            gflat, self.inverse = np.unique(flat, return_inverse=True)
+        self.keys = [k.astype(np.int64) - shift for k in np.unravel_index(gflat, shape)]
+        self.n = len(gflat)
+
+    @classmethod
+    def of(cls, encs: list, mask=None) -> "Groups":
+        return cls([e.codes for e in encs], [len(e) for e in encs], mask)
+
+    def size(self) -> np.ndarray:
+        return np.bincount(self.inverse, minlength=self.n)
+
+    def sum(self, values) -> np.ndarray:
+        vals = np.asarray(values)[self.rows]
+        return np.bincount(self.inverse, weights=vals, minlength=self.n).astype(np.int64)
+
+    def max(self, values, initial: int = -1) -> np.ndarray:
+        out = np.full(self.n, initial, dtype=np.int64)
+        np.maximum.at(out, self.inverse, np.asarray(values, dtype=np.int64)[self.rows])
+        return out
+
+    def min(self, values) -> np.ndarray:
+        return -self.max(-np.asarray(values, dtype=np.int64), initial=np.iinfo(np.int64).min + 1)
+
+    def nunique(self, enc: Encoded) -> np.ndarray:
+        """Distinct non-missing values of enc per group (0 for all-missing groups)."""
+        v = enc.codes[self.rows]
+        ok = v >= 0
+        if not ok.any():
+            return np.zeros(self.n, dtype=np.int64)
+        width = len(enc)
+        # sort + dedupe rather than np.unique, whose hash path (numpy >= 2.3)
+        # is many times slower on wide keys like these
+        pairs = np.sort(self.inverse[ok] * width + v[ok])
+        pairs = pairs[np.r_[True, pairs[1:] != pairs[:-1]]]
+        return np.bincount(pairs // width, minlength=self.n)
+
+    def rollup(self, which: list) -> "Groups":
+        """Regroup the groups themselves by a subset of their keys."""
+        return Groups([self.keys[i] for i in which], [self.dims[i] for i in which])
+
+
+def argmax_by(owner, values, tiebreak):
+    """Per owner code, the tiebreak code with the largest value (smallest on ties).
+
+    Returns (owners, winners), both sorted by owner.
+    """
+    if not len(owner):
+        return owner, tiebreak
+    order = np.lexsort((tiebreak, -np.asarray(values), owner))
+    o = owner[order]
+    first = np.ones(len(o), dtype=bool)
+    first[1:] = o[1:] != o[:-1]
+    return o[first], tiebreak[order][first]
+
+
+def first_seen(enc: Encoded) -> np.ndarray:
+    """Codes of enc ordered by first appearance (like pd.unique)."""
+    c = enc.codes[enc.codes >= 0]
+    uniq, idx = np.unique(c, return_index=True)
+    return uniq[np.argsort(idx, kind="stable")]
+
+
+def ordered_counts(uniques, codes, counts, first) -> pd.Series:
+    """Counts per code, count desc, ties by first position (-1 = NaN label)."""
+    if not len(codes):
+        return pd.Series([], dtype=np.int64)
+    counts = np.asarray(counts, dtype=np.int64)
+    order = np.lexsort((first, -counts))
+    index = [uniques[c] if c >= 0 else np.nan for c in np.asarray(codes)[order].tolist()]
+    return pd.Series(counts[order], index=pd.Index(index, dtype=object))
+
+
+def value_counts(enc: Encoded, dropna: bool = True) -> pd.Series:
+    """Like Series.value_counts: count desc, ties in order of first appearance."""
+    codes = enc.codes if not dropna else enc.codes[enc.codes >= 0]
+    present, first, counts = np.unique(codes, return_index=True, return_counts=True)
+    return ordered_counts(enc.uniques, present, counts, first)
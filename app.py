@@ -1,12 +1,29 @@
+import json
 import os
 import re
-from io import BytesIO
-from flask import Flask, render_template, request
+from functools import lru_cache
+from flask import Flask, Response, abort, jsonify, make_response, redirect, render_template, request
+import numpy as np
 import pandas as pd
 from werkzeug.utils import secure_filename
 
+from aggregate import Encoded, Groups, argmax_by, encode, relabel
+from cube import FilterCube
+from ingest import SHEET_COLUMN, SKIPPED_SHEETS, SUPPORTED_FORMATS, file_format, read_upload, resolve_columns
+from classify import rules_from_env
+from normalize import nonempty, normalize_frame, strip_text
+from ranking import BASES, GLOBAL, TOP_K, page as rank_page, rank_partitions
+from report_cache import KEY_RE, cache_key, cache_from_env
+from report_state import SAMPLE_ROWS, ReportState, Table, merge as merge_states
+from store import RECORD_FILTERS, default_term, store_from_env, valid_term
+from jobs import QueueFull, jobs_from_env
+import export
+import instrument
+import slices
+import wire
+
 # ---------------- basic config ----------------
-ALLOWED_EXTENSIONS = {"xlsx", "xls"}
+ALLOWED_EXTENSIONS = set(SUPPORTED_FORMATS)
 
 def allowed_file(filename: str) -> bool:
     return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -24,19 +41,6 @@ def _sid(x) -> str:
     s = str(x).strip()
     return re.sub(r"\.0+$", "", s)
 
-def _canon_qual(x: str) -> str:
-    """Unify qualification names."""
-    if x is None or (isinstance(x, float) and pd.isna(x)):
-        return "Unknown"
-    s = str(x).strip().upper()
-    if s in {"BBIS", "BBIS-B"}:
-        return "BBIS"
-    if s in {"BITW", "BITW-B"}:
-        return "BITW"
-    if s in {"HCS", "HCS-B"}:
-        return "HCS"
-    return s if s else "Unknown"
-
 def _counts(series: pd.Series) -> dict:
     out = {}
     for k, v in series.items():
@@ -52,38 +56,37 @@ def _sort_weeks_like(weeks) -> list:
 
 
 # ---------------- cleaning ----------------
-def _strip_obj_cols(df: pd.DataFrame) -> pd.DataFrame:
-    df = df.copy()
-    for c in df.columns:
-        if pd.api.types.is_object_dtype(df[c]):
-            df[c] = df[c].astype(str).str.strip()
-            df[c].replace({"": pd.NA}, inplace=True)
-    return df
+def _is_text(series: pd.Series) -> bool:
+    dtype = series.dtype
+    if isinstance(dtype, pd.CategoricalDtype):
+        dtype = dtype.categories.dtype
+    return pd.api.types.is_object_dtype(dtype) or isinstance(dtype, pd.StringDtype)
 
 
-def clean_dataframe(df: pd.DataFrame):
+def clean_dataframe(df: pd.DataFrame, columns=None):
     # Clean raw Excel into valid records:
     # - Trim column names and string cells
     # - Drop fully-empty rows
     # - Keep rows even if Student Number is missing (for catalogue parity)
     # - No deduplication
+    # Works on df in place, one column at a time: each text column in
+    # `columns` (default: all) is swapped for a stripped categorical, so the
+    # upload is never copied whole. Other columns are left as they are.
     stats = {}
-    df0 = df.copy()
-    df0.columns = [str(c).strip() for c in df0.columns]
-    stats["rows_raw"] = int(len(df0))
-
-    # Strip whitespace in object columns and normalize blanks to NA
-    def _strip_obj_cols(df_in: pd.DataFrame) -> pd.DataFrame:
-        df_in = df_in.copy()
-        for c in df_in.columns:
-            if pd.api.types.is_object_dtype(df_in[c]):
-                df_in[c] = df_in[c].astype(str).str.strip()
-                df_in[c].replace({"": pd.NA}, inplace=True)
-        return df_in
-
-    df1 = _strip_obj_cols(df0)
-    df1 = df1.dropna(how="all")
-    stats["rows_after_drop_all_empty"] = int(len(df1))
+    df.columns = [str(c).strip() for c in df.columns]
+    stats["rows_raw"] = int(len(df))
+
+    # Strip whitespace in text columns and normalize blanks to NA
+    for c in (df.columns if columns is None else columns):
+        if _is_text(df[c]):
+            df[c] = strip_text(df[c])
+
+    # the sheet name ingest puts on every row of a multi-sheet workbook is
+    # not a cell of the upload: a row with nothing else in it is still empty
+    keep = df.drop(columns=SHEET_COLUMN, errors="ignore").notna().any(axis=1).to_numpy()
+    if not keep.all():
+        df = df[keep]
+    stats["rows_after_drop_all_empty"] = int(len(df))
 
     # No dropping based on Student Number
     stats["dropped_missing_student_number"] = 0
@@ -91,154 +94,237 @@ def clean_dataframe(df: pd.DataFrame):
     # No deduplication to preserve raw record counts
     stats["dropped_duplicates_full_row"] = 0
 
-    stats["rows_final"] = int(len(df1))
-    return df1, stats
+    stats["rows_final"] = int(len(df))
+
+    # sheets of a multi-sheet workbook not laid out like its data sheets
+    stats["skipped_sheets"] = list(df.attrs.get(SKIPPED_SHEETS, []))
+    return df, stats
 
 # ---------------- core report builder ----------------
-def build_report(df: pd.DataFrame) -> dict:
+# how reasons, risk levels and resolved cells are read (classify.py, REPORT_RULES)
+RULES = rules_from_env()
+# Bump whenever build_report's output changes so cached reports get rebuilt.
+# The rules' digest is part of it: other rules make other reports.
+REPORT_VERSION = "10-" + RULES.digest
+# progress stages reported to background jobs and instrument.py, in order
+# ("read" is the upload parse, "store" the record store save). A progress
+# hook is called as progress(stage, rows=...) with the rows the stage works on.
+REPORT_STAGES = ("read", "clean", "normalize", "store", "aggregate", "students", "ranking", "cache")
+
+def build_state(df: pd.DataFrame, progress=None, on_frame=None) -> ReportState:
+    """Clean and normalize an upload and summarize it into mergeable tables.
+
+    on_frame(df, cols), if given, sees the cleaned and normalized frame.
+    df itself is cleaned in place and should not be used afterwards.
+    """
+    progress = progress or (lambda stage, rows=None: None)
+
     # Clean first
-    df, cleaning_stats = clean_dataframe(df)
-    df = df.copy()
+    progress("clean", rows=len(df))
     df.columns = [str(c).strip() for c in df.columns]
 
-    # likely column names
-    col_student = next((c for c in df.columns if c.lower().startswith("student number")), None)
-    col_name    = next((c for c in df.columns if c.lower().startswith("student name")), None)
-    col_module  = next((c for c in df.columns if c.lower().startswith("module")), None)
-    col_week    = next((c for c in df.columns if c.lower() == "week"), None)
-    col_reason  = next((c for c in df.columns if "reason" in c.lower()), None)
-    col_risk    = next((c for c in df.columns if "risk" in c.lower()), None)
-    col_resolved= next((c for c in df.columns if "resolved" in c.lower()), None)
-    col_interv = next((c for c in df.columns if "intervention" in c.lower()), None)
-    col_qual    = next((c for c in df.columns if ("qual" in c.lower()
-                                                  or "program" in c.lower()
-                                                  or "programme" in c.lower()
-                                                  or "course" in c.lower())), None)
-
-    if col_week:
-        df[col_week] = df[col_week].astype(str)
-    if col_qual:
-        df["_qual"] = df[col_qual].map(_canon_qual)
+    # likely column names; only these get cleaned
+    cols = resolve_columns(df.columns)
+    df, cleaning_stats = clean_dataframe(df, list(dict.fromkeys(cols.values())) or None)
+    col_student = cols.get("student")
+    col_name    = cols.get("name")
+    col_module  = cols.get("module")
+    col_week    = cols.get("week")
+    col_reason  = cols.get("reason")
+    col_risk    = cols.get("risk")
+    col_resolved= cols.get("resolved")
+    col_interv  = cols.get("intervention")
+
+    # canonical ids / quals / risk ranks, text columns interned as categoricals
+    progress("normalize", rows=len(df))
+    df = normalize_frame(df, cols, RULES)
+    if on_frame is not None:
+        progress("store", rows=len(df))
+        on_frame(df, cols)
+
+    n = len(df)
+    progress("aggregate", rows=n)
+    # Total records: SN present OR (Name & Module & Week present)
+    has_sn = nonempty(df[col_student]) if col_student else np.zeros(n, dtype=bool)
+    if col_name and col_module and col_week:
+        has_triplet = nonempty(df[col_name]) & nonempty(df[col_module]) & nonempty(df[col_week])
     else:
-        df["_qual"] = "Unknown"
-
-        # Total records: Student Number present OR (Student Name & Module(s) & Week present)
-    col_student = next((c for c in df.columns if c.lower().startswith("student number")), None)
-    col_name    = next((c for c in df.columns if c.lower().startswith("student name")), None)
-    col_module  = next((c for c in df.columns if c.lower().startswith("module")), None)
-    col_week    = next((c for c in df.columns if c.lower() == "week"), None)
-    def _nonempty(s):
-        return s.astype(str).str.strip().replace({"": pd.NA, "nan": pd.NA}).notna()
-    has_sn = _nonempty(df[col_student]) if col_student else pd.Series([False]*len(df))
-    has_triplet = (
-        (_nonempty(df[col_name]) if col_name else False) &
-        (_nonempty(df[col_module]) if col_module else False) &
-        (_nonempty(df[col_week]) if col_week else False)
-    )
-        # Total records: SN present OR (Name & Module & Week present)
-    col_student = next((c for c in df.columns if c.lower().startswith("student number")), None)
-    col_name    = next((c for c in df.columns if c.lower().startswith("student name")), None)
-    col_module  = next((c for c in df.columns if c.lower().startswith("module")), None)
-    col_week    = next((c for c in df.columns if c.lower() == "week"), None)
-    def _nonempty(s):
-        return s.astype(str).str.strip().replace({"": pd.NA, "nan": pd.NA}).notna()
-    has_sn = _nonempty(df[col_student]) if col_student else pd.Series([False]*len(df))
-    has_triplet = (
-        (_nonempty(df[col_name]) if col_name else False) &
-        (_nonempty(df[col_module]) if col_module else False) &
-        (_nonempty(df[col_week]) if col_week else False)
-    )
+        has_triplet = np.zeros(n, dtype=bool)
     total_records = int((has_sn | has_triplet).sum())
-    unique_students = int(df[col_student].dropna().astype(str).nunique()) if col_student else 0
-
-
-    unique_students = int(df[col_student].nunique()) if col_student else None
 
-    # non-attendance mask (tolerant)
-    att_mask = None
+    # non-attendance mask (tolerant), one rule-set match per distinct reason
+    att_mask = np.zeros(n, dtype=bool)
     if col_reason:
-        rx = r"(absent|no\s*show|did\s*not\s*attend|not\s*attend|missed\s*class|attendance)"
-        att_mask = df[col_reason].astype(str).str.contains(rx, flags=re.I, regex=True, na=False)
+        att_mask = RULES.attendance(df[col_reason])
+
+    # Resolved status via Intervention non-empty, else a Resolved column
+    truthy = None
+    if col_interv:
+        truthy = nonempty(df[col_interv])
+    elif col_resolved:
+        truthy = RULES.resolved(df[col_resolved])
+
+    # ----- encode once: every table below is keyed by integer codes -----
+    empty = Encoded(np.full(n, -1), [])
+    encs = {
+        "sid":      encode(df["_sid"]) if col_student else empty,  # canonical ids ("123.0" -> "123")
+        "mod":      encode(df[col_module]) if col_module else empty,
+        "wk":       encode(df[col_week]) if col_week else empty,
+        "risk":     encode(df[col_risk]) if col_risk else empty,
+        "qual":     encode(df["_qual"]),
+        "name":     relabel(encode(df[col_name]), str) if col_name else empty,
+        "reason":   encode(df[col_reason]) if col_reason else empty,
+        "resolved": encode(df[col_resolved]) if col_resolved and not col_interv else empty,
+    }
+    ones = np.ones(n, dtype=np.int64)
+    first = np.arange(n, dtype=np.int64)  # row position, for "order of first appearance"
+
+    def table(dims, **values):
+        return Table.of(dims, [encs[d].codes for d in dims], [len(encs[d]) for d in dims], values)
+
+    smw = {"rows": ones, "att": att_mask.astype(np.int64)}
+    if col_risk:
+        smw["risk_max"] = df["_risk_rank"].to_numpy()
+    tables = {
+        "smw": table(("sid", "mod", "wk"), **smw),
+        "squal": table(("sid", "qual"), rows=ones, first=first),
+        "sname": table(("sid", "name"), rows=ones),
+        "swr": table(("sid", "wk", "risk"), rows=ones),
+        "cube": table(("sid", "wk", "mod", "qual", "risk"), rows=ones, att=att_mask.astype(np.int64)),
+        "risk": table(("risk",), rows=ones, first=first),
+        "reason": table(("reason",), rows=ones, first=first),
+        "resolved": table(("resolved",), rows=ones, first=first),
+        "wk": table(("wk",), rows=ones, truthy=(truthy if truthy is not None else np.zeros(n, dtype=bool)).astype(np.int64)),
+    }
+    totals = {"rows": n, "total_records": total_records,
+              "resolved_yes": int(truthy.sum()) if col_interv else 0}
+
+    # sample rows
+    sample_rows = df.head(SAMPLE_ROWS).drop(columns="_sid", errors="ignore").astype(object).fillna("").to_dict(orient="records")
+
+    return ReportState(REPORT_VERSION, cols, list(df.columns), {d: e.uniques for d, e in encs.items()},
+                       tables, totals, cleaning_stats, sample_rows)
+
+
+def assemble_report(state: ReportState, top_k: int = TOP_K, progress=None) -> dict:
+    """The report dict for a (possibly merged) ReportState."""
+    progress = progress or (lambda stage, rows=None: None)
+    cols = state.roles
+    col_student = cols.get("student")
+    col_name    = cols.get("name")
+    col_module  = cols.get("module")
+    col_week    = cols.get("week")
+    col_reason  = cols.get("reason")
+    col_risk    = cols.get("risk")
+    col_resolved= cols.get("resolved")
+    col_interv  = cols.get("intervention")
+    totals = state.totals
+    n = totals["rows"]
+
+    # (student, module, week) table: rows, absences and max risk rank per key
+    smw = state.tables["smw"]
+    sid, mod, wk = (state.column("smw", d) for d in ("sid", "mod", "wk"))
+    absences = smw.values["att"]
+    att_mask = absences > 0 if col_reason else None
+
+    unique_students = len(state.vocab["sid"]) if col_student else None
 
     # globals
-    risk_counts     = _counts(df[col_risk].value_counts(dropna=False)) if col_risk else {}
+    risk_counts     = _counts(state.counts("risk", dropna=False)) if col_risk else {}
     # Resolved status via Intervention non-empty
-    if "col_interv" in locals() and col_interv:
-        vals = df[col_interv].astype(str).str.strip()
-        yes = int(vals.replace({"": pd.NA, "nan": pd.NA}).notna().sum())
-        no = int(len(vals) - yes)
-        resolved = {"Yes": yes, "No": no}
-        resolved_counts = resolved
+    has_truthy = bool(col_interv or col_resolved)
+    if col_interv:
+        yes = totals["resolved_yes"]
+        resolved_counts = {"Yes": yes, "No": int(n - yes)}
+    elif col_resolved:
+        resolved_counts = _counts(state.counts("resolved", dropna=False))
     else:
-        resolved_counts = _counts(df[col_resolved].value_counts(dropna=False)) if col_resolved else {}
-    by_reason       = _counts(df[col_reason].value_counts().head(15)) if col_reason else {}
+        resolved_counts = {}
+    by_reason       = _counts(state.counts("reason").head(15)) if col_reason else {}
 
-    weeks   = _sort_weeks_like(df[col_week].dropna().unique()) if col_week else []
-    modules = sorted(df[col_module].dropna().astype(str).unique()) if col_module else []
-    quals   = sorted(pd.unique(df["_qual"]).tolist())
+    weeks   = _sort_weeks_like(wk.uniques) if col_week else []
+    modules = sorted(set(mod.labels))
+    quals   = sorted(state.vocab["qual"])
+
+    def _desc(groups, values) -> dict:
+        # same ordering as groupby(...).sort_values(ascending=False)
+        s = pd.Series(values, index=[mod.labels[k] for k in groups.keys[0].tolist()])
+        return {str(k): int(v) for k, v in s.sort_values(ascending=False).items()}
 
     # module unique students (overall)
     by_module = {}
     if col_module and col_student:
-        tmp = df.groupby(col_module)[col_student].nunique().sort_values(ascending=False)
-        by_module = {str(k): int(v) for k, v in tmp.items()}
+        g = Groups.of([mod])
+        by_module = _desc(g, g.nunique(sid))
 
-    # non-attendance per module (unique students)
+    # non-attendance per module (unique students) + total absences (all rows)
     by_module_att = {}
-    if col_module and col_student and att_mask is not None:
-        tmp = df[att_mask].groupby(col_module)[col_student].nunique().sort_values(ascending=False)
-        by_module_att = {str(k): int(v) for k, v in tmp.items()}
-    # NEW: total absences per module (count all rows, not unique students)
     by_module_abs_total = {}
     if col_module and att_mask is not None:
-        tmp2 = df[att_mask].groupby(col_module).size().sort_values(ascending=False)
-        by_module_abs_total = {str(k): int(v) for k, v in tmp2.items()}
+        g = Groups.of([mod], att_mask)
+        if col_student:
+            by_module_att = _desc(g, g.nunique(sid))
+        by_module_abs_total = _desc(g, g.sum(absences))
 
     # non-attendance per week (unique students)
     by_week_att = {}
     if col_week and col_student and att_mask is not None:
-        tmp = df[att_mask].groupby(col_week)[col_student].nunique()
-        by_week_att = {str(k): int(v) for k, v in tmp.items()}
+        g = Groups.of([wk], att_mask)
+        by_week_att = {wk.labels[w]: int(v) for w, v in zip(g.keys[0].tolist(), g.nunique(sid).tolist())}
 
     # per (week, module) unique students — all and non-attendance
     by_week_module_all = {}
     by_week_module_att = {}
-    if col_week and col_module:
-        all_g = df.groupby([col_week, col_module])[col_student].nunique()
-        for (w, m), v in all_g.items():
-            by_week_module_all.setdefault(str(w), {})[str(m)] = int(v)
-
+    if col_week and col_module and col_student:
+        passes = [(None, by_week_module_all)]
         if att_mask is not None:
-            att_g = df[att_mask].groupby([col_week, col_module])[col_student].nunique()
-            for (w, m), v in att_g.items():
-                by_week_module_att.setdefault(str(w), {})[str(m)] = int(v)
+            passes.append((att_mask, by_week_module_att))
+        for mask, out in passes:
+            g = Groups.of([wk, mod], mask)
+            for w, m, v in zip(g.keys[0].tolist(), g.keys[1].tolist(), g.nunique(sid).tolist()):
+                out.setdefault(wk.labels[w], {})[mod.labels[m]] = int(v)
+
+    # module chart counts for every week / qualification / risk filter (see cube.py)
+    filter_cube = None
+    if col_module and col_student:
+        cube = state.tables["cube"]
+        c_sid, c_wk, c_mod, c_qual, c_risk = (state.column("cube", d) for d in cube.dims)
+        filter_cube = FilterCube.of(c_sid, c_mod, {"week": c_wk, "qual": c_qual, "risk": c_risk},
+                                    cube.values["rows"], cube.values["att"])
+    risk_levels = sorted(state.vocab["risk"]) if col_risk else []
+
+    # (student, week, risk) table
+    swr = state.tables["swr"]
+    swr_sid, swr_wk, swr_risk = (state.column("swr", d) for d in ("sid", "wk", "risk"))
 
-    # week x risk (for chart)
+    # week x risk (for chart): rows with a student number, per (week, risk)
     week_risk = {}
-    if col_week and col_risk:
-        pivot = df.pivot_table(index=col_week, columns=col_risk, values=col_student, aggfunc="count", fill_value=0)
-        pivot = pivot.reindex(_sort_weeks_like(pivot.index.to_series()))
+    if col_week and col_risk and col_student:
+        g = Groups.of([swr_wk, swr_risk])
+        counts = g.sum(swr.values["rows"] * swr_sid.valid())
+        w_codes = np.unique(g.keys[0])
+        r_codes = np.unique(g.keys[1])
+        grid = np.zeros((len(w_codes), len(r_codes)), dtype=np.int64)
+        grid[np.searchsorted(w_codes, g.keys[0]), np.searchsorted(r_codes, g.keys[1])] = counts
+        row_of = {wk.labels[w]: i for i, w in enumerate(w_codes.tolist())}
+        week_rows = [row_of[w] for w in _sort_weeks_like(list(row_of))]
         week_risk = {
-            "weeks": [str(x) for x in list(pivot.index)],
-            "series": [{"name": str(c), "data": [int(v) for v in pivot[c].tolist()]} for c in pivot.columns],
+            "weeks": [str(wk.labels[w_codes[i]]) for i in week_rows],
+            "series": [{"name": swr_risk.labels[r], "data": [int(v) for v in grid[week_rows, j].tolist()]}
+                       for j, r in enumerate(r_codes.tolist())],
         }
 
     # resolved rate by week (%)
     resolved_rate = {}
-    if col_week and (("col_interv" in locals() and col_interv) or col_resolved):
-        if ("col_interv" in locals() and col_interv):
-            vals = df[col_interv].astype(str).str.strip()
-            truthy = vals.replace({"": pd.NA, "nan": pd.NA}).notna()
-        else:
-            vals = df[col_resolved].astype(str).str.strip().str.lower()
-            truthy = vals.isin({"yes", "y", "true", "1", "resolved"})
-        grp = df.groupby(col_week)
-        totals = grp.size()
-        trues = grp.apply(lambda g: int(truthy.loc[g.index].sum()))
-        for w in totals.index:
-            resolved_rate[str(w)] = round((int(trues.loc[w]) / int(totals.loc[w])) * 100, 1) if int(totals.loc[w]) else 0.0
+    if col_week and has_truthy:
+        t = state.tables["wk"]
+        g = Groups.of([state.column("wk", "wk")])
+        totals_w, trues = g.sum(t.values["rows"]).tolist(), g.sum(t.values["truthy"]).tolist()
+        for w, tot, tr in zip(g.keys[0].tolist(), totals_w, trues):
+            resolved_rate[wk.labels[w]] = round((int(tr) / int(tot)) * 100, 1) if int(tot) else 0.0
 
     # ----- student analytics -----
+    progress("students", rows=len(state.vocab["sid"]))
     student_enabled = bool(col_student)
     student_lookup = []
     ps_modules_att = {}
@@ -250,155 +336,135 @@ def build_report(df: pd.DataFrame) -> dict:
     ps_week_module_att = {}          # sid -> module -> week -> absence count
     student_module_summary = {}      # sid -> list of {module, total_absences, rate}
     module_week_capacity = {}        # module -> week -> max sessions (derived)
+    g_sm = None                      # (student, module) groups, also used for ranking
 
-    # build name + qualification maps
     if student_enabled:
-        tmp = df[[col_student, col_name, "_qual"]].dropna(subset=[col_student]).copy()
-        tmp["_sid"] = tmp[col_student].apply(_sid)
-
-        # names
+        # names + quals: most common value per student (ties -> smallest)
+        name_map = {}
         if col_name:
-            nm = tmp.groupby("_sid")[col_name].agg(
-                lambda s: s.dropna().astype(str).mode().iat[0] if not s.dropna().empty else ""
-            )
-            name_map = nm.to_dict()
-        else:
-            name_map = {}
-
-        # quals
-        ql = tmp.groupby("_sid")["_qual"].agg(
-            lambda s: s.dropna().astype(str).mode().iat[0] if not s.dropna().empty else "Unknown"
-        )
-        qual_map = ql.to_dict()
-
-        # student lookup
-        order = pd.unique(df[col_student].dropna().apply(_sid)).tolist()
-        for sid in order:
-            nm = (name_map.get(sid, "") or "").strip()
-            ql = (qual_map.get(sid, "") or "").strip()
-            label = f"{sid} — {nm}" if nm else sid
+            s_enc, name = state.column("sname", "sid"), state.column("sname", "name")
+            g = Groups.of([s_enc, name])
+            owners, winners = argmax_by(g.keys[0], g.sum(state.tables["sname"].values["rows"]), g.keys[1])
+            name_map = {sid.labels[s]: name.labels[v] for s, v in zip(owners.tolist(), winners.tolist())}
+        squal = state.tables["squal"]
+        s_enc, qual = state.column("squal", "sid"), state.column("squal", "qual")
+        g = Groups.of([s_enc, qual])
+        owners, winners = argmax_by(g.keys[0], g.sum(squal.values["rows"]), g.keys[1])
+        qual_map = {sid.labels[s]: qual.labels[v] for s, v in zip(owners.tolist(), winners.tolist())}
+
+        # student lookup, in order of first appearance
+        g = Groups.of([s_enc])
+        firsts = g.min(squal.values["first"])
+        order = [sid.labels[c] for c in g.keys[0][np.argsort(firsts, kind="stable")].tolist()]
+        for s in order:
+            nm = (name_map.get(s, "") or "").strip()
+            ql = (qual_map.get(s, "") or "").strip()
+            label = f"{s} — {nm}" if nm else s
             display = f"{label} — [{ql}]" if ql else label
-            student_lookup.append({"id": sid, "label": display, "name": nm, "qual": ql})
+            student_lookup.append({"id": s, "label": display, "name": nm, "qual": ql})
 
         # student non-attendance by module
         if att_mask is not None and col_module:
-            g = df[att_mask].groupby([col_student, col_module]).size()
-            for (sid_raw, mod), v in g.items():
-                sid = _sid(sid_raw)
-                ps_modules_att.setdefault(sid, {})[str(mod)] = int(v)
+            g_sm = Groups.of([sid, mod], att_mask)
+            for s, m, v in zip(g_sm.keys[0].tolist(), g_sm.keys[1].tolist(), g_sm.sum(absences).tolist()):
+                ps_modules_att.setdefault(sid.labels[s], {})[mod.labels[m]] = int(v)
 
         # student non-attendance by week
         if att_mask is not None and col_week:
-            g = df[att_mask].groupby([col_student, col_week]).size()
-            for (sid_raw, w), v in g.items():
-                sid = _sid(sid_raw)
-                ps_weeks_att.setdefault(sid, {})[str(w)] = int(v)
+            g = Groups.of([sid, wk], att_mask)
+            for s, w, v in zip(g.keys[0].tolist(), g.keys[1].tolist(), g.sum(absences).tolist()):
+                ps_weeks_att.setdefault(sid.labels[s], {})[wk.labels[w]] = int(v)
 
         # risk by module (max)
         if col_risk and col_module:
-            # rank risks
-            def _rank(s):
-                s = str(s).lower()
-                if "high" in s or "red" in s: return 3
-                if "med" in s or "amber" in s or "yellow" in s: return 2
-                if "low" in s or "green" in s: return 1
-                return 0
-            df["_risk_rank"] = df[col_risk].map(_rank)
-            g = df.groupby([col_student, col_module])["_risk_rank"].max()
-            for (sid_raw, mod), r in g.items():
-                sid = _sid(sid_raw)
-                lab = {3:"High",2:"Moderate",1:"Low",0:"Unknown"}[int(r)]
-                ps_risk_module_max.setdefault(sid, {})[str(mod)] = lab
+            g = Groups.of([sid, mod])
+            for s, m, r in zip(g.keys[0].tolist(), g.keys[1].tolist(), g.max(smw.values["risk_max"]).tolist()):
+                ps_risk_module_max.setdefault(sid.labels[s], {})[mod.labels[m]] = RULES.risk.labels[int(r)]
 
         # week x risk per student (counts)
         if col_week and col_risk:
-            g = df.groupby([col_student, col_week, col_risk]).size()
-            for (sid_raw, w, rk), v in g.items():
-                sid = _sid(sid_raw)
-                ps_week_risk_counts.setdefault(sid, {}).setdefault(str(w), {})[str(rk)] = int(v)
+            g = Groups.of([swr_sid, swr_wk, swr_risk])
+            for s, w, r, v in zip(g.keys[0].tolist(), g.keys[1].tolist(), g.keys[2].tolist(), g.sum(swr.values["rows"]).tolist()):
+                ps_week_risk_counts.setdefault(sid.labels[s], {}).setdefault(wk.labels[w], {})[swr_risk.labels[r]] = int(v)
 
         # ---------- NEW: capacity + per-student per-module rates ----------
-        if att_mask is not None and col_module and col_week and col_student:
+        if att_mask is not None and col_module and col_week:
             # absences per student per (module, week)
-            by_smw = df[att_mask].groupby([col_student, col_module, col_week]).size()
+            g_smw = Groups.of([sid, mod, wk], att_mask)
+            smw_abs = g_smw.sum(absences)
 
             # module-week capacity = max absences any student recorded in that (module, week)
-            max_per_mw = by_smw.groupby([col_module, col_week]).max()
-            for (mod, w), v in max_per_mw.items():
-                module_week_capacity.setdefault(str(mod), {})[str(w)] = int(v)
+            g_mw = g_smw.rollup([1, 2])
+            for m, w, v in zip(g_mw.keys[0].tolist(), g_mw.keys[1].tolist(), g_mw.max(smw_abs).tolist()):
+                module_week_capacity.setdefault(mod.labels[m], {})[wk.labels[w]] = int(v)
 
             # store per-student week detail (for heatmap)
-            for (sid_raw, mod, w), v in by_smw.items():
-                sid = _sid(sid_raw)
-                ps_week_module_att.setdefault(sid, {}).setdefault(str(mod), {})[str(w)] = int(v)
+            keys = zip(g_smw.keys[0].tolist(), g_smw.keys[1].tolist(), g_smw.keys[2].tolist(), smw_abs.tolist())
+            for s, m, w, v in keys:
+                ps_week_module_att.setdefault(sid.labels[s], {}).setdefault(mod.labels[m], {})[wk.labels[w]] = int(v)
 
             # per-student module totals + % using capacity
-            for sid in pd.unique(df[col_student].dropna().apply(_sid)):
-                rows = []
+            # denominator: sum of capacity for this module over all known weeks
+            denom_of = {m: sum(int(caps.get(w, 0)) for w in weeks) for m, caps in module_week_capacity.items()}
+            for s in order:
+                rows_out = []
+                wk_maps = ps_week_module_att.get(s, {})
                 # all modules this student has non-attendance in
-                mods_for_sid = sorted(ps_week_module_att.get(sid, {}).keys())
-                for mod in mods_for_sid:
-                    wk_map = ps_week_module_att[sid][mod]     # week -> absent count
-                    total_abs = int(sum(wk_map.values()))
-                    # denominator: sum of capacity for this module over all known weeks
-                    caps = module_week_capacity.get(mod, {})
-                    denom = sum(int(caps.get(w, 0)) for w in weeks)  # keep week order consistent
+                for m in sorted(wk_maps.keys()):
+                    total_abs = int(sum(wk_maps[m].values()))
+                    denom = denom_of.get(m, 0)
                     rate = round((total_abs / denom) * 100, 1) if denom else 0.0
-                    rows.append({"module": mod, "total_absences": total_abs, "rate": rate})
-                student_module_summary[sid] = rows
+                    rows_out.append({"module": m, "total_absences": total_abs, "rate": rate})
+                student_module_summary[s] = rows_out
 
     # ---- build “top students” (absences + per-module rate best) ----
     # For the global list we aggregate absences across all modules and compute
-    # a rate weighted by the module capacities.
-    global_top_students_att = []
-    module_top_students_att = {}  # mod -> [{id,label,count,rate,qual}]
-    if student_enabled:
+    # a rate weighted by the module capacities. Every list is ranked in one
+    # partitioned sort; the page embeds the first top_k, the rest is paged.
+    progress("ranking", rows=g_sm.n if g_sm is not None else 0)
+    ranking = {"global": [], "modules": {}}
+    if student_enabled and g_sm is not None and g_sm.n:
         # convenient maps
         sid_to_label = {s["id"]: s["label"] for s in student_lookup}
         sid_to_qual  = {s["id"]: s["qual"]  for s in student_lookup}
-
-        # global totals
-        for sid, mcounts in ps_modules_att.items():
-            count = int(sum(mcounts.values()))
-            # rate denominator: sum of capacities of all modules this student has records for
-            denom = 0
-            for mod in mcounts.keys():
-                denom += sum(module_week_capacity.get(mod, {}).get(w, 0) for w in weeks)
-            rate = round((count / denom) * 100, 1) if denom else 0.0
-            global_top_students_att.append({
-                "id": sid, "label": sid_to_label.get(sid, sid),
-                "count": count, "rate": rate, "qual": sid_to_qual.get(sid, "")
-            })
-        # sort by absences desc
-        global_top_students_att.sort(key=lambda x: (-x["count"], -x["rate"]))
-
-        # per-module lists
-        if att_mask is not None and col_module:
-            g = df[att_mask].groupby([col_student, col_module]).size()
-            # build helper for per-student per-module rate
-            for mod in modules:
-                rows = []
-                caps = module_week_capacity.get(str(mod), {})
-                denom_mod = sum(caps.get(w, 0) for w in weeks)
-                # students with absences in this module
-                sub = g[g.index.get_level_values(1) == mod]
-                for (sid_raw, _), cnt in sub.items():
-                    sid = _sid(sid_raw)
-                    rate = round((int(cnt) / denom_mod) * 100, 1) if denom_mod else 0.0
-                    rows.append({
-                        "id": sid, "label": sid_to_label.get(sid, sid),
-                        "count": int(cnt), "rate": rate, "qual": sid_to_qual.get(sid, "")
-                    })
-                rows.sort(key=lambda x: (-x["count"], -x["rate"]))
-                if rows:
-                    module_top_students_att[str(mod)] = rows
-
-    # sample rows
-    sample_rows = df.head(50).fillna("").to_dict(orient="records")
+        mod_denom = {m: sum(caps.get(w, 0) for w in weeks) for m, caps in module_week_capacity.items()}
+        denom_of_mod = np.array([mod_denom.get(m, 0) for m in mod.labels], dtype=np.int64)
+
+        def _rate(count, denom):
+            return round((count / denom) * 100, 1) if denom else 0.0
+
+        # per (student, module) rows, then per-student totals
+        # (rate denominator: sum of capacities of all modules the student has absences in)
+        pair_counts = g_sm.sum(absences)
+        pair_denoms = denom_of_mod[g_sm.keys[1]]
+        g_s = g_sm.rollup([0])
+        stu_counts, stu_denoms = g_s.sum(pair_counts), g_s.sum(pair_denoms)
+
+        parts = np.concatenate([g_sm.keys[1], np.full(g_s.n, GLOBAL)])
+        students = np.concatenate([g_sm.keys[0], g_s.keys[0]])
+        counts = np.concatenate([pair_counts, stu_counts]).tolist()
+        rates = [_rate(c, d) for c, d in zip(counts, np.concatenate([pair_denoms, stu_denoms]).tolist())]
+        students_l = students.tolist()
+
+        def _rows(idx):
+            out = []
+            for i in idx.tolist():
+                s = sid.labels[students_l[i]]
+                out.append({"id": s, "label": sid_to_label.get(s, s),
+                            "count": int(counts[i]), "rate": rates[i], "qual": sid_to_qual.get(s, "")})
+            return out
+
+        ranked = rank_partitions(parts, students, counts, rates)
+        ranking["global"] = _rows(ranked.pop(GLOBAL, np.empty(0, dtype=np.int64)))
+        by_label = {mod.labels[m]: idx for m, idx in ranked.items()}
+        ranking["modules"] = {m: _rows(by_label[m]) for m in modules if m in by_label}
+
+    global_top_students_att = ranking["global"][:top_k]
+    module_top_students_att = {m: rows[:top_k] for m, rows in ranking["modules"].items()}  # mod -> [{id,label,count,rate,qual}]
 
     return {
-        "cleaning_stats": cleaning_stats,
-        "total_records": total_records,
+        "cleaning_stats": dict(state.cleaning_stats),
+        "total_records": totals["total_records"],
         "unique_students": unique_students,
         "risk_counts": risk_counts,
         "resolved_counts": resolved_counts,
@@ -406,6 +472,7 @@ def build_report(df: pd.DataFrame) -> dict:
         "weeks": weeks,
         "modules": modules,
         "qualifications": quals,
+        "risk_levels": risk_levels,
         "by_module": by_module,
         "by_module_attendance": by_module_att,
         "by_module_abs_total": by_module_abs_total,
@@ -414,6 +481,7 @@ def build_report(df: pd.DataFrame) -> dict:
         "by_week_module_attendance": by_week_module_att,
         "week_risk": week_risk,
         "resolved_rate": resolved_rate,
+        "filter_cube": filter_cube,                         # served by /module-counts
 
         # student analytics
         "student_enabled": student_enabled,
@@ -429,15 +497,75 @@ def build_report(df: pd.DataFrame) -> dict:
         # top lists
         "global_top_students_att": global_top_students_att,
         "module_top_students_att": module_top_students_att,
+        "ranking": ranking,                                 # full ranked lists, served in pages
 
-        "sample_rows": sample_rows,
+        "sample_rows": list(state.sample_rows),
     }
 
 
+def build_report(df: pd.DataFrame, top_k: int = TOP_K, progress=None) -> dict:
+    return assemble_report(build_state(df, progress), top_k, progress)
+
+
 # ---------------- flask app ----------------
 app = Flask(__name__)
 app.config["MAX_CONTENT_LENGTH"] = 64 * 1024 * 1024  # 64MB
 
+report_cache = cache_from_env()
+jobs = jobs_from_env()
+record_store = store_from_env()
+
+# the page embeds the summary only; per-student data comes from the JSON API
+app.add_template_filter(slices.summary, "client_payload")
+app.add_template_global(default_term, "default_term")
+# Server-Timing headers, /metrics and the REPORT_PROFILE switch
+instrument.init_app(app)
+
+def _load_report(report_id: str):
+    # cache first; a report that has dropped out of it is rebuilt from the record store
+    report = report_cache.get(report_id)
+    if report is None and record_store is not None and KEY_RE.fullmatch(report_id or ""):
+        df = record_store.load_frame(report_id)
+        if df is not None:
+            report = _store_report(report_id, build_state(df, instrument.stage), instrument.stage)
+    return report
+
+def _stored_report(report_id: str):
+    report = _load_report(report_id)
+    if report is None:
+        abort(make_response(jsonify(error="Report not found or expired. Please upload the file again."), 404))
+    return report
+
+# every cached report keeps the aggregate state it was assembled from, so a
+# later upload of just the new rows can be merged into it (see report_state.py)
+def _state_key(report_id: str) -> str:
+    return cache_key(report_id.encode(), REPORT_VERSION, "state")
+
+def _store_report(key: str, state: ReportState, progress=None) -> dict:
+    report = assemble_report(state, progress=progress)
+    if progress is not None:
+        progress("cache")
+    report_cache.put(key, report)
+    report_cache.put(_state_key(key), state)
+    return report
+
+def _saver(key: str, term: str, filename: str, parent: str = None):
+    # on_frame hook for build_state: keep the cleaned rows in the record store
+    if record_store is None or not term:
+        return None
+    return lambda df, cols: record_store.save(key, term, df, cols, filename=filename, parent=parent)
+
+def _upload_term() -> str:
+    term = (request.form.get("term") or "").strip() or default_term()
+    if not valid_term(term):
+        raise ValueError("Term names are up to 32 letters, digits, spaces, dots, dashes or underscores.")
+    return term
+
+def _found(payload, what: str):
+    if payload is None:
+        abort(make_response(jsonify(error=f"{what} not found in this report."), 404))
+    return jsonify(payload)
+
 @app.route("/", methods=["GET"])
 def index():
     return render_template("index.html", report=None, filename=None, error=None)
@@ -452,15 +580,268 @@ def upload():
         return render_template("index.html", report=None, filename=None, error="No selected file")
 
     if not allowed_file(f.filename):
-        return render_template("index.html", report=None, filename=None, error="Please upload an Excel file (.xlsx/.xls).")
+        return render_template("index.html", report=None, filename=None, error="Please upload an Excel, CSV or Parquet file (.xlsx/.xls/.csv/.parquet).")
 
     try:
+        term = _upload_term()
         content = f.read()
-        df = pd.read_excel(BytesIO(content))
-        report = build_report(df)
-        return render_template("index.html", report=report, filename=secure_filename(f.filename), error=None)
+        key = cache_key(content, REPORT_VERSION, file_format(f.filename))
+        report = report_cache.get(key)
+        if report is None:
+            instrument.stage("read")
+            df = read_upload(content, f.filename)
+            state = build_state(df, instrument.stage, on_frame=_saver(key, term, f.filename))
+            report = _store_report(key, state, instrument.stage)
+        instrument.stage("render")
+        return render_template("index.html", report=report, report_id=key, filename=secure_filename(f.filename), error=None)
     except Exception as e:
-        return render_template("index.html", report=None, filename=None, error=f"Failed to read Excel: {e}")
+        return render_template("index.html", report=None, filename=None, error=f"Failed to read file: {e}")
+
+@app.route("/reports/<report_id>", methods=["GET"])
+def show_report(report_id):
+    report = _load_report(report_id)
+    if report is None:
+        return render_template("index.html", report=None, filename=None,
+                               error="That report has expired. Please upload the file again.")
+    instrument.stage("render")
+    return render_template("index.html", report=report, report_id=report_id, filename=None, error=None)
+
+@app.route("/reports/<report_id>/append", methods=["POST"])
+def append_rows(report_id):
+    # incremental mode: merge only the new rows into the report's stored state
+    f = request.files.get("file")
+    if f is None or f.filename == "":
+        return render_template("index.html", report=None, filename=None, error="No selected file")
+    if not allowed_file(f.filename):
+        return render_template("index.html", report=None, filename=None, error="Please upload an Excel, CSV or Parquet file (.xlsx/.xls/.csv/.parquet).")
+
+    base = report_cache.get(_state_key(report_id))
+    if base is None and _load_report(report_id) is not None:
+        base = report_cache.get(_state_key(report_id))  # rebuilt from the record store
+    if base is None:
+        return render_template("index.html", report=None, filename=None,
+                               error="That report has expired. Please upload the full workbook again.")
+    try:
+        content = f.read()
+        key = cache_key(content, REPORT_VERSION, file_format(f.filename), "append", report_id)
+        report = report_cache.get(key)
+        if report is None:
+            instrument.stage("read")
+            df = read_upload(content, f.filename)
+            # stored only if the report it extends is in the record store too
+            term = record_store.term_of(report_id) if record_store is not None else None
+            delta = build_state(df, instrument.stage, on_frame=_saver(key, term, f.filename, parent=report_id))
+            instrument.stage("merge", rows=delta.totals["rows"])
+            report = _store_report(key, merge_states(base, delta), instrument.stage)
+        instrument.stage("render")
+        return render_template("index.html", report=report, report_id=key, filename=secure_filename(f.filename), error=None)
+    except Exception as e:
+        return render_template("index.html", report=None, filename=None, error=f"Failed to add rows: {e}")
+
+# ---------------- background jobs ----------------
+# POST /jobs takes the same form as /upload but answers at once with a job id;
+# the client polls /jobs/<id> (or listens on /jobs/<id>/events) and opens
+# /reports/<report_id> when it is done. Reports reach the web workers through
+# the disk cache, so job mode needs REPORT_CACHE_DIR.
+def _build_job(content: bytes, filename: str, key: str, term: str, progress) -> dict:
+    progress("read")
+    # job processes are the parallelism here: a sheet pool in each would
+    # multiply processes by REPORT_SHEET_WORKERS, so sheets are read in turn
+    df = read_upload(content, filename, parallel=False)
+    _store_report(key, build_state(df, progress, on_frame=_saver(key, term, filename)), progress)
+    return {"report_id": key}
+
+def _job_error(message: str, status: int, **extra):
+    return make_response(jsonify(error=message, **extra), status)
+
+def _stored_job(job_id: str) -> dict:
+    state = jobs.status(job_id)
+    if state is None:
+        abort(_job_error("Job not found or expired.", 404))
+    return state
+
+@app.route("/jobs", methods=["POST"])
+def submit_job():
+    f = request.files.get("file")
+    if f is None or f.filename == "":
+        return _job_error("No selected file", 400)
+    if not allowed_file(f.filename):
+        return _job_error("Please upload an Excel, CSV or Parquet file (.xlsx/.xls/.csv/.parquet).", 400)
+    if not report_cache.directory:
+        return _job_error("Background jobs need REPORT_CACHE_DIR; upload directly instead.", 503)
+    try:
+        term = _upload_term()
+    except ValueError as e:
+        return _job_error(str(e), 400)
+
+    content = f.read()
+    key = cache_key(content, REPORT_VERSION, file_format(f.filename))
+    if report_cache.get(key) is not None:
+        return jsonify(id=None, status="done", result={"report_id": key})
+    try:
+        job_id = jobs.submit(_build_job, content, f.filename, key, term, stages=REPORT_STAGES)
+    except QueueFull as e:
+        resp = _job_error(f"Server busy: {e} Please try again shortly.", 429, queue=jobs.stats())
+        resp.headers["Retry-After"] = "10"
+        return resp
+    resp = jsonify(jobs.status(job_id))
+    resp.status_code = 202
+    resp.headers["Location"] = f"/jobs/{job_id}"
+    return resp
+
+@app.route("/jobs/stats", methods=["GET"])
+def job_stats():
+    return jsonify(jobs.stats())
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+    return jsonify(_stored_job(job_id))
+
+@app.route("/jobs/<job_id>", methods=["DELETE"])
+def cancel_job(job_id):
+    _stored_job(job_id)
+    return jsonify(jobs.cancel(job_id))
+
+@app.route("/jobs/<job_id>/events", methods=["GET"])
+def job_events(job_id):
+    # server-sent events: one message per state change. Each open stream holds
+    # a worker thread, so prefer polling with the default sync workers.
+    _stored_job(job_id)
+    stream = (f"data: {json.dumps(state)}\n\n" for state in jobs.events(job_id))
+    return Response(stream, mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# ---------------- report JSON API ----------------
+@app.route("/api/reports/<report_id>", methods=["GET"])
+def report_summary(report_id):
+    return jsonify(slices.summary(_stored_report(report_id)))
+
+@app.route("/api/reports/<report_id>/students", methods=["GET"])
+def search_students(report_id):
+    report = _stored_report(report_id)
+    limit = max(1, min(request.args.get("limit", 20, type=int), 200))
+    return jsonify(slices.search_students(report, request.args.get("q", ""), limit))
+
+@app.route("/api/reports/<report_id>/students/<sid>", methods=["GET"])
+def student_detail(report_id, sid):
+    return _found(slices.student_slice(_stored_report(report_id), _sid(sid)), "Student")
+
+# all per-student maps at once, in the compact columnar format (see wire.py).
+# Reports never change under an id, so encoded bodies are memoized per encoding.
+@lru_cache(maxsize=16)
+def _student_data_body(report_id: str, encoding: str) -> bytes:
+    body = wire.dumps(wire.encode_students(_stored_report(report_id)))
+    return wire.compress(body, encoding)
+
+@app.route("/api/reports/<report_id>/student-data", methods=["GET"])
+def student_data(report_id):
+    encoding = request.accept_encodings.best_match(wire.ENCODINGS) or "identity"
+    body = _student_data_body(report_id, encoding)
+    if encoding != "identity" and len(body) < wire.MIN_COMPRESS:
+        encoding, body = "identity", _student_data_body(report_id, "identity")
+    resp = make_response(body)
+    resp.mimetype = "application/json"
+    if encoding != "identity":
+        resp.headers["Content-Encoding"] = encoding
+    resp.headers["Vary"] = "Accept-Encoding"
+    resp.headers["Cache-Control"] = "private, max-age=3600"
+    resp.set_etag(f"{report_id}-{encoding}")
+    return resp.make_conditional(request)
+
+@app.route("/api/reports/<report_id>/modules/<module>", methods=["GET"])
+def module_detail(report_id, module):
+    return _found(slices.module_slice(_stored_report(report_id), module), "Module")
+
+@app.route("/api/reports/<report_id>/module-counts", methods=["GET"])
+def module_counts(report_id):
+    report = _stored_report(report_id)
+    filters = {f: request.args.get(f, "") for f in ("week", "qual", "risk")}
+    return _found(slices.module_counts(report, filters, request.args.get("basis", "all"),
+                                       max(0, request.args.get("top", 0, type=int))), "Filter value")
+
+@app.route("/api/reports/<report_id>/weeks/<week>", methods=["GET"])
+def week_detail(report_id, week):
+    return _found(slices.week_slice(_stored_report(report_id), week), "Week")
+
+@app.route("/api/reports/<report_id>/top-students", methods=["GET"])
+def top_students(report_id):
+    report = _stored_report(report_id)
+    basis = request.args.get("basis", "count")
+    return jsonify(rank_page(
+        report.get("ranking", {}),
+        module=request.args.get("module", ""),
+        qual=request.args.get("qual", ""),
+        basis=basis if basis in BASES else "count",
+        band=request.args.get("band", ""),
+        offset=request.args.get("offset", 0, type=int),
+        limit=min(request.args.get("limit", TOP_K, type=int), 500),
+    ))
+
+# ---------------- exports ----------------
+# CSV / XLSX downloads of report tables and of the stored records, streamed
+# as they are written (see export.py)
+def _download(fmt: str, name: str, header, rows, title: str) -> Response:
+    return Response(export.stream(fmt, header, rows, title), mimetype=export.FORMATS[fmt],
+                    headers={"Content-Disposition": f'attachment; filename="{secure_filename(name)}.{fmt}"',
+                             "Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route("/api/reports/<report_id>/export/records.<any(csv, xlsx):fmt>", methods=["GET"])
+def export_records(report_id, fmt):
+    # the cleaned rows as uploaded, read from the record store as they go out
+    filters = {f: request.args.get(f, "").strip() for f in RECORD_FILTERS}
+    filters["student"] = _sid(filters["student"]) if filters["student"] else ""
+    found = _store_or_404().records(report_id, filters)
+    if found is None:
+        abort(make_response(jsonify(error="No stored records for this report."), 404))
+    columns, rows = found
+    return _download(fmt, f"records-{report_id[:12]}", columns, rows, "Records")
+
+@app.route("/api/reports/<report_id>/export/<table>.<any(csv, xlsx):fmt>", methods=["GET"])
+def export_table(report_id, table, fmt):
+    if table not in export.TABLES:
+        abort(make_response(jsonify(error=f"Unknown table {table!r}."), 404))
+    build, title, params = export.TABLES[table]
+    report = _stored_report(report_id)
+    args = {k: request.args.get(k, "").strip() for k in params}
+    if args.get("student"):
+        args["student"] = _sid(args["student"])
+    if "basis" in args and args["basis"] not in BASES:
+        args["basis"] = "count"
+    found = build(report, **args)
+    if found is None:
+        abort(make_response(jsonify(error="Module or student not found in this report."), 404))
+    header, rows = found
+    return _download(fmt, f"{table}-{report_id[:12]}", header, rows, title)
+
+# ---------------- record store API ----------------
+def _store_or_404():
+    if record_store is None:
+        abort(make_response(jsonify(error="The record store is disabled (REPORT_STORE_PATH)."), 404))
+    return record_store
+
+@app.route("/api/terms", methods=["GET"])
+def list_terms():
+    return jsonify(_store_or_404().terms())
+
+@app.route("/terms/<term>", methods=["GET"])
+def show_term(term):
+    # a term's report is the one of its latest upload
+    latest = next((t for t in _store_or_404().terms() if t["term"] == term), None)
+    if latest is None:
+        return render_template("index.html", report=None, filename=None, error=f"No stored records for term {term}.")
+    return redirect(f"/reports/{latest['report_id']}")
+
+@app.route("/api/students/<sid>/history", methods=["GET"])
+def student_history(sid):
+    # one student across every stored term, via the student index
+    terms = _store_or_404().student_history(_sid(sid), term=request.args.get("term") or None)
+    if not terms:
+        abort(make_response(jsonify(error="No stored records for this student."), 404))
+    return jsonify(student=_sid(sid), terms=terms)
+
+@app.route("/cache/stats", methods=["GET"])
+def cache_stats():
+    return jsonify(report_cache.stats())
 
 
 if __name__ == "__main__":
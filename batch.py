@@ -0,0 +1,204 @@
+"""Precompute reports for many workbooks at once, e.g. overnight.
+
+    python batch.py exports/ -o reports/                 # every workbook in a directory
+    python batch.py "exports/**/*.xlsx" -o reports/ --format both
+    python batch.py exports/ -o reports/ --term 2026-S1  # also fill the record store
+
+Workbooks are built in a pool of processes, with the same calls /upload
+makes. Each report goes into the report cache under the key an upload of
+the same file would get, so with the web app's REPORT_CACHE_DIR the app
+serves it at /reports/<key> straight away. Its page payload (JSON, as
+/api/reports/<key> returns it) and/or the rendered page (HTML) are written
+to --out, next to a manifest of the content hash of every input: the next
+run skips workbooks that have not changed. A timing summary per workbook
+is printed at the end.
+"""
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+MANIFEST = "manifest.json"
+FORMATS = {"json": ("json",), "html": ("html",), "both": ("json", "html")}
+
+
+def find_inputs(patterns: list) -> list:
+    """Workbook paths under directories / matching globs, in a stable order."""
+    from ingest import SUPPORTED_FORMATS, file_format
+
+    found = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            paths = [os.path.join(root, f) for root, _, files in os.walk(pattern) for f in files]
+        else:
+            paths = glob.glob(pattern, recursive=True)
+        found += sorted(p for p in paths if os.path.isfile(p) and file_format(p) in SUPPORTED_FORMATS
+                        and not os.path.basename(p).startswith("~$"))  # Excel lock files
+    return list(dict.fromkeys(os.path.abspath(p) for p in found))
+
+
+def _write(path: str, text: str) -> None:
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as fh:
+        fh.write(text)
+    os.replace(tmp, path)  # the app or a reader never sees half a file
+
+
+def build(path: str, key: str, out_dir: str, name: str, formats: tuple, term: str = "") -> dict:
+    """Runs in a pool process: one workbook into the report cache and out_dir."""
+    import app
+    import slices
+    from flask import render_template
+    from ingest import read_upload
+    from instrument import StageTimer
+
+    timer = StageTimer()
+    started = time.perf_counter()
+    timer("read")
+    with open(path, "rb") as fh:
+        content = fh.read()
+    filename = os.path.basename(path)
+    # one workbook per process already: its sheets are read in turn
+    df = read_upload(content, filename, parallel=False)
+    # stored under its full path: a rerun replaces this workbook's records in
+    # the term, and workbooks of the same name in other directories are kept
+    state = app.build_state(df, timer, on_frame=app._saver(key, term, path))
+    del df
+    report = app._store_report(key, state, timer)
+
+    timer("write")
+    outputs = []
+    if "json" in formats:
+        outputs.append(name + ".json")
+        _write(os.path.join(out_dir, outputs[-1]), json.dumps(slices.summary(report), default=str))
+    if "html" in formats:
+        # the page loads per-student data from the app's JSON API, like an uploaded one
+        with app.app.test_request_context("/"):
+            html = render_template("index.html", report=report, report_id=key, filename=filename, error=None)
+        outputs.append(name + ".html")
+        _write(os.path.join(out_dir, outputs[-1]), html)
+    timer.stop()
+    return {
+        "rows": state.totals["rows"],
+        "outputs": outputs,
+        "seconds": round(time.perf_counter() - started, 3),
+        "stages": {s["stage"]: s["seconds"] for s in timer.stages},
+    }
+
+
+def _load_manifest(path: str) -> dict:
+    try:
+        with open(path, encoding="utf-8") as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return {}
+
+
+def print_summary(results: dict, stages: tuple, wall: float) -> None:
+    width = max([len(os.path.relpath(p)) for p in results] + [4])
+    cols = [max(len(s), 5) + 2 for s in stages]
+    print(f"\n{'file':<{width}}  {'status':<8}{'rows':>9}" + "".join(f"{s:>{w}}" for s, w in zip(stages, cols))
+          + f"{'total':>9}")
+    for path, r in results.items():
+        cells = [f"{r['stages'][s]:.2f}" if s in r.get("stages", {}) else "-" for s in stages]
+        total = f"{r['seconds']:.2f}" if r["status"] == "built" else "-"
+        rows = f"{r['rows']:,}" if r.get("rows") is not None else "-"
+        print(f"{os.path.relpath(path):<{width}}  {r['status']:<8}{rows:>9}"
+              + "".join(f"{c:>{w}}" for c, w in zip(cells, cols)) + f"{total:>9}")
+        if r.get("error"):
+            print(f"  {r['error']}")
+    counts = {s: sum(r["status"] == s for r in results.values()) for s in ("built", "skipped", "failed")}
+    busy = sum(r.get("seconds", 0) for r in results.values() if r["status"] == "built")
+    print(f"\n{counts['built']} built, {counts['skipped']} unchanged, {counts['failed']} failed "
+          f"in {wall:.1f}s ({busy:.1f}s of building)")
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Build reports for many workbooks in parallel.")
+    ap.add_argument("inputs", nargs="+", help="workbooks, directories or glob patterns")
+    ap.add_argument("-o", "--out", required=True, help="directory for the reports and the manifest")
+    ap.add_argument("--format", default="json", choices=tuple(FORMATS), help="what to write per workbook")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="processes (default: one per CPU)")
+    ap.add_argument("--term", default="", help="also keep the records in the record store under this term")
+    ap.add_argument("--force", action="store_true", help="rebuild unchanged workbooks too")
+    args = ap.parse_args(argv)
+
+    # reports go to disk; pool processes need not also keep them in memory
+    os.environ.setdefault("REPORT_CACHE_ITEMS", "0")
+    import app
+    from ingest import file_format
+    from report_cache import cache_key
+    from store import valid_term
+    from werkzeug.utils import secure_filename
+
+    if args.term and not valid_term(args.term):
+        ap.error("term names are up to 32 letters, digits, spaces, dots, dashes or underscores")
+    if not app.report_cache.directory:
+        print("warning: REPORT_CACHE_DIR is empty, so the web app will not see these reports", file=sys.stderr)
+    paths = find_inputs(args.inputs)
+    if not paths:
+        print("no workbooks found", file=sys.stderr)
+        return 1
+    os.makedirs(args.out, exist_ok=True)
+    manifest_path = os.path.join(args.out, MANIFEST)
+    manifest = _load_manifest(manifest_path)
+    files = manifest.get("files", {})
+    formats = FORMATS[args.format]
+
+    # hash every input; unchanged ones (same key, outputs and cache entry) are skipped
+    results, todo = {}, []
+    for path in paths:
+        with open(path, "rb") as fh:
+            key = cache_key(fh.read(), app.REPORT_VERSION, file_format(path))
+        name = secure_filename(os.path.relpath(path)) or key[:16]
+        seen = files.get(path, {})
+        fresh = (seen.get("key") == key and set(seen.get("outputs", ())) >= {f"{name}.{f}" for f in formats}
+                 and all(os.path.exists(os.path.join(args.out, o)) for o in seen.get("outputs", ()))
+                 and (app.report_cache.has(key) or not app.report_cache.directory)
+                 # with --term, its records must be in the store under that term
+                 and (not args.term or app.record_store is None or app.record_store.term_of(key) == args.term))
+        if fresh and not args.force:
+            results[path] = {"status": "skipped", "rows": seen.get("rows")}
+        else:
+            results[path] = {"status": "queued"}
+            todo.append((path, key, name))
+
+    started = time.perf_counter()
+
+    def finished(path: str, key: str, out: dict) -> None:
+        results[path] = dict(out, status="built")
+        files[path] = {"key": key, "report": f"/reports/{key}", "term": args.term, "outputs": out["outputs"],
+                       "rows": out["rows"], "seconds": out["seconds"], "built": time.time()}
+
+    workers = max(1, min(args.workers, len(todo)))
+    if workers == 1:
+        for path, key, name in todo:
+            try:
+                finished(path, key, build(path, key, args.out, name, formats, args.term))
+            except Exception as e:
+                results[path] = {"status": "failed", "error": f"{type(e).__name__}: {e}"}
+    elif todo:
+        # spawn, like the job pool: each process imports the app afresh
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            futures = {pool.submit(build, path, key, args.out, name, formats, args.term): (path, key)
+                       for path, key, name in todo}
+            for fut in as_completed(futures):
+                path, key = futures[fut]
+                try:
+                    finished(path, key, fut.result())
+                except Exception as e:
+                    results[path] = {"status": "failed", "error": f"{type(e).__name__}: {e}"}
+
+    _write(manifest_path, json.dumps({"version": app.REPORT_VERSION, "files": files}, indent=2) + "\n")
+    stages = app.REPORT_STAGES + ("write",)
+    print_summary(results, stages, time.perf_counter() - started)
+    return 1 if any(r["status"] == "failed" for r in results.values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
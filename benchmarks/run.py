@@ -0,0 +1,236 @@
+"""Benchmarks for the report pipeline.
+
+    python -m benchmarks.run                      # 10k and 100k rows vs baselines.json
+    python -m benchmarks.run --sizes 10k,100k,1m  # up to a million rows
+    python -m benchmarks.run --update             # record new baselines
+
+Every stage of an upload is timed on its own (best of --repeat runs): the
+file parse, each build stage (through the same progress hook background jobs
+use) and serialization of the page payload, the student-data bundle and the
+cache entry. The whole /upload request is timed too. A second pass under
+tracemalloc records the peak memory of each stage (memory pyarrow allocates
+for string columns is not traced). The run fails if a stage
+got more than --tolerance slower, or used more than --memory-tolerance more
+memory, than its baseline. Baselines are machine-specific: record them on the
+machine that runs the comparison.
+"""
+import argparse
+import gc
+import json
+import os
+import pickle
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.synth import parse_size, to_bytes, workbook
+
+BASELINES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+DEFAULT_SIZES = "10k,100k"
+MIN_DELTA = 0.02  # seconds; differences below this are noise
+MB = 1024 * 1024
+
+
+class Splits:
+    """Progress hook that times (and optionally memory-profiles) each stage."""
+
+    def __init__(self, memory: bool = False):
+        self.memory = memory
+        self.seconds, self.peak_mb = {}, {}
+        self._stage, self._t0 = None, 0.0
+
+    def __call__(self, stage: str, rows: int = None) -> None:
+        self.stop()
+        self._stage, self._t0 = stage, time.perf_counter()
+        if self.memory:
+            tracemalloc.reset_peak()
+
+    def stop(self) -> None:
+        if self._stage is None:
+            return
+        self.seconds[self._stage] = self.seconds.get(self._stage, 0.0) + time.perf_counter() - self._t0
+        if self.memory:
+            peak = tracemalloc.get_traced_memory()[1] / MB
+            self.peak_mb[self._stage] = max(self.peak_mb.get(self._stage, 0.0), peak)
+        self._stage = None
+
+
+def pipeline(content: bytes, filename: str, splits: Splits) -> None:
+    """One upload through the same calls the app makes, stage by stage."""
+    import app
+    import slices
+    import wire
+    from ingest import read_upload
+
+    splits("read")
+    df = read_upload(content, filename)
+    saver = app._saver("0" * 64, "bench", filename)
+    state = app.build_state(df, progress=splits, on_frame=saver)  # clean, normalize, store, aggregate
+    del df
+    splits("breakdowns")
+    report = app.assemble_report(state, progress=splits)  # students, ranking
+    splits("page_json")
+    json.dumps(slices.summary(report), default=str)
+    splits("bundle")
+    wire.dumps(wire.encode_students(report))
+    splits("cache_pickle")
+    pickle.dumps(report, protocol=pickle.HIGHEST_PROTOCOL)
+    pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)
+    splits.stop()
+
+
+def upload_request(client, content: bytes, filename: str) -> float:
+    from io import BytesIO
+
+    t0 = time.perf_counter()
+    resp = client.post("/upload", data={"file": (BytesIO(content), filename), "term": "bench"},
+                       content_type="multipart/form-data")
+    seconds = time.perf_counter() - t0
+    if resp.status_code != 200 or b"Failed to read file" in resp.data:
+        raise RuntimeError(f"/upload failed with status {resp.status_code}")
+    return seconds
+
+
+def bench(rows: int, params: dict, fmt: str, repeat: int, memory: bool, client) -> dict:
+    df = workbook(rows, **params)
+    content = to_bytes(df, fmt)
+    filename = f"bench.{fmt}"
+    del df
+    limit = client.application.config.get("MAX_CONTENT_LENGTH")
+    uploadable = not limit or len(content) <= limit  # the app rejects larger uploads (413)
+    seconds = {}
+    for _ in range(repeat):
+        gc.collect()
+        splits = Splits()
+        pipeline(content, filename, splits)
+        if uploadable:
+            splits.seconds["upload"] = upload_request(client, content, filename)
+        for stage, s in splits.seconds.items():
+            seconds[stage] = min(seconds.get(stage, s), s)
+    out = {"rows": rows, "params": params, "format": fmt, "bytes": len(content),
+           "seconds": {k: round(v, 4) for k, v in seconds.items()}}
+    if not uploadable:
+        out["note"] = f"upload not timed: {len(content) / MB:.0f}MB is over the app's {limit / MB:.0f}MB limit"
+    if memory:
+        gc.collect()
+        splits = Splits(memory=True)
+        tracemalloc.start()
+        try:
+            pipeline(content, filename, splits)
+        finally:
+            tracemalloc.stop()
+        out["peak_mb"] = {k: round(v, 1) for k, v in splits.peak_mb.items()}
+    return out
+
+
+def compare(result: dict, base: dict, tolerance: float, memory_tolerance: float) -> list:
+    """Regressions of result against its baseline, as messages."""
+    problems = []
+    for stage, s in result["seconds"].items():
+        b = base.get("seconds", {}).get(stage)
+        if b is not None and s > b * (1 + tolerance) and s - b > MIN_DELTA:
+            problems.append(f"{stage}: {s:.3f}s vs {b:.3f}s baseline (+{(s / b - 1) * 100:.0f}%)")
+    for stage, mb in result.get("peak_mb", {}).items():
+        b = base.get("peak_mb", {}).get(stage)
+        if b is not None and mb > b * (1 + memory_tolerance) and mb - b > 1:
+            problems.append(f"{stage}: peak {mb:.1f}MB vs {b:.1f}MB baseline")
+    return problems
+
+
+def print_table(label: str, result: dict, base: dict) -> None:
+    print(f"\n{label}: {result['rows']:,} rows, {result['bytes'] / MB:.1f}MB {result['format']}")
+    if result.get("peak_mb"):
+        peak = max(result["peak_mb"].values())
+        print(f"  peak {peak:.0f}MB traced, {peak * MB / result['bytes']:.1f}x the input")
+    print(f"  {'stage':<14}{'seconds':>10}{'baseline':>10}{'peak MB':>10}{'baseline':>10}")
+    for stage, s in result["seconds"].items():
+        b = base.get("seconds", {}).get(stage)
+        mb = result.get("peak_mb", {}).get(stage)
+        bmb = base.get("peak_mb", {}).get(stage)
+        cells = [f"{s:.3f}", f"{b:.3f}" if b is not None else "-",
+                 f"{mb:.1f}" if mb is not None else "-", f"{bmb:.1f}" if bmb is not None else "-"]
+        print(f"  {stage:<14}" + "".join(f"{c:>10}" for c in cells))
+    if result.get("note"):
+        print(f"  ({result['note']})")
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Time and memory-profile the report pipeline.")
+    ap.add_argument("--sizes", default=DEFAULT_SIZES, help="comma-separated row counts, e.g. 10k,100k,1m")
+    ap.add_argument("--students", type=int, default=None, help="cohort size (default: rows / 20)")
+    ap.add_argument("--modules", type=int, default=40)
+    ap.add_argument("--weeks", type=int, default=20)
+    ap.add_argument("--reasons", default="", help='reason mix, e.g. "Absent=0.5,Poor marks=0.5"')
+    ap.add_argument("--messy", type=float, default=0.1, help='share of ids like "123.0" or " 123"')
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--format", default="csv", choices=("csv", "xlsx", "parquet"))
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--no-memory", action="store_true", help="skip the tracemalloc pass")
+    ap.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown per stage (0.25 = 25%%)")
+    ap.add_argument("--memory-tolerance", type=float, default=0.15)
+    ap.add_argument("--baselines", default=BASELINES)
+    ap.add_argument("--update", action="store_true", help="store these results as the new baselines")
+    ap.add_argument("--json", dest="json_out", default="", help="also write results to this file")
+    args = ap.parse_args(argv)
+
+    # a private cache and store: repeated uploads must rebuild, not hit the cache
+    work = tempfile.mkdtemp(prefix="soit-bench-")
+    os.environ.update(REPORT_CACHE_DIR="", REPORT_CACHE_ITEMS="0", REPORT_JOB_DIR=os.path.join(work, "jobs"),
+                      REPORT_STORE_PATH=os.path.join(work, "records.sqlite3"))
+    import app
+    client = app.app.test_client()
+
+    params = {"students": args.students, "modules": args.modules, "weeks": args.weeks,
+              "messy": args.messy, "seed": args.seed}
+    if args.reasons:
+        params["reason_mix"] = {k.strip(): float(v) for k, v in
+                                (part.rsplit("=", 1) for part in args.reasons.split(","))}
+
+    try:
+        with open(args.baselines, encoding="utf-8") as fh:
+            baselines = json.load(fh)
+    except FileNotFoundError:
+        baselines = {}
+    known = baselines.get("results", {})
+
+    results, failures = {}, []
+    try:
+        for label in [s.strip() for s in args.sizes.split(",") if s.strip()]:
+            result = bench(parse_size(label), params, args.format, max(1, args.repeat), not args.no_memory, client)
+            results[label] = result
+            base = known.get(label, {})
+            if base and (base.get("params") != result["params"] or base.get("format") != result["format"]):
+                print(f"\n{label}: baseline was recorded with other parameters, not compared")
+                base = {}
+            print_table(label, result, base)
+            failures += [f"{label} {p}" for p in compare(result, base, args.tolerance, args.memory_tolerance)]
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as fh:
+            json.dump(results, fh, indent=2)
+    if args.update:
+        known.update(results)
+        baselines = {"machine": f"{platform.machine()} / {platform.python_implementation()} "
+                                f"{platform.python_version()} / {os.cpu_count()} CPUs",
+                     "results": known}
+        with open(args.baselines, "w", encoding="utf-8") as fh:
+            json.dump(baselines, fh, indent=2)
+            fh.write("\n")
+        print(f"\nbaselines written to {args.baselines}")
+        return 0
+    if failures:
+        print("\nREGRESSIONS:")
+        for f in failures:
+            print("  " + f)
+        return 1
+    print("\nno regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,121 @@
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+# ---------------- synthetic workbooks ----------------
+# Deterministic stand-ins for the weekly at-risk export. A cohort of students,
+# each with a qualification and a few enrolled modules, is flagged week after
+# week; a few students account for many of the flags. Cells are as messy as
+# the real sheets: ids typed as 123.0 or padded with spaces, qualification
+# spellings that normalize to the same code, blank rows and cells, and
+# columns the report never reads.
+
+REASON_MIX = {
+    "Absent": 0.26,
+    "No show": 0.08,
+    "Did not attend": 0.06,
+    "Missed class": 0.06,
+    "Late submission": 0.16,
+    "Failed test": 0.14,
+    "Poor marks": 0.16,
+    "": 0.08,
+}
+ATTENDANCE_REASONS = {"Absent", "No show", "Did not attend", "Missed class"}
+
+# spellings of a handful of qualifications, as they turn up in the sheets
+QUALIFICATIONS = (
+    ("BBIS", "bbis", "BBIS-B", " BBIS "),
+    ("BITW", "bitw-b", "BITW"),
+    ("HCS", "HCS-B", " hcs"),
+    ("DIP", "Dip", "DIP-B"),
+    ("CERT", "cert"),
+)
+RISK_LEVELS = ("High", "Moderate", "Low", "Red", "Amber", "Green", "")
+INTERVENTIONS = ("", "", "Email sent", "Meeting booked", "Referred to student support")
+
+
+def parse_size(text: str) -> int:
+    """10k / 1m / 25000 -> rows."""
+    t = str(text).strip().lower().replace("_", "")
+    scale = {"k": 1_000, "m": 1_000_000}.get(t[-1:], 1)
+    return int(float(t.rstrip("km")) * scale)
+
+
+def workbook(rows: int = 10_000, students: int = None, modules: int = 40, weeks: int = 20,
+             reason_mix: dict = None, messy: float = 0.1, seed: int = 0) -> pd.DataFrame:
+    """An at-risk workbook of `rows` flag rows, the same for the same arguments.
+
+    students defaults to one per 20 rows; messy is the share of student
+    numbers written as "123.0" or with stray spaces.
+    """
+    rng = np.random.default_rng(seed)
+    students = students or max(1, rows // 20)
+    mix = reason_mix or REASON_MIX
+
+    # cohort: ids, names, qualification spelling and 2-6 modules each
+    ids = rng.choice(np.arange(200_000_000, 300_000_000), size=students, replace=False)
+    names = np.array([f"Student {i:05d}" for i in range(students)], dtype=object)
+    qual_of = rng.integers(0, len(QUALIFICATIONS), students)
+    n_mods = rng.integers(2, 7, students)
+    enrolled = rng.integers(0, modules, (students, 6))
+    module_names = np.array([f"MOD{m:03d}" for m in range(modules)], dtype=object)
+
+    # rows: a skewed share of students gets most flags
+    weight = rng.pareto(1.5, students) + 1
+    who = rng.choice(students, size=rows, p=weight / weight.sum())
+    mod = enrolled[who, (rng.random(rows) * n_mods[who]).astype(np.int64)]
+    week = np.minimum(weeks, 1 + (rng.random(rows) ** 0.8 * weeks).astype(np.int64))  # later weeks a bit busier
+
+    reasons = np.array(list(mix), dtype=object)
+    p = np.array(list(mix.values()), dtype=float)
+    reason = reasons[rng.choice(len(reasons), size=rows, p=p / p.sum())]
+    attendance = np.isin(reason, list(ATTENDANCE_REASONS))
+    risk = np.array(RISK_LEVELS, dtype=object)[
+        np.where(attendance, rng.choice(len(RISK_LEVELS), rows, p=[.3, .2, .05, .2, .15, .05, .05]),
+                 rng.choice(len(RISK_LEVELS), rows, p=[.1, .25, .25, .05, .15, .15, .05]))]
+
+    sid = ids[who].astype(str).astype(object)
+    roll = rng.random(rows)
+    sid[roll < messy * 0.7] = np.char.add(ids[who][roll < messy * 0.7].astype(str), ".0")
+    pad = (roll >= messy * 0.7) & (roll < messy)
+    sid[pad] = np.char.add(" ", ids[who][pad].astype(str))
+    sid[rng.random(rows) < 0.01] = ""
+
+    spellings = np.array([s for group in QUALIFICATIONS for s in group], dtype=object)
+    count = np.array([len(group) for group in QUALIFICATIONS])
+    start = np.r_[0, np.cumsum(count)[:-1]]
+    q = qual_of[who]
+    qual = spellings[start[q] + rng.integers(0, 1 << 16, rows) % count[q]]
+
+    df = pd.DataFrame({
+        "Student Number": sid,
+        "Student Name": names[who],
+        "Qualification": qual,
+        "Module Code": module_names[mod],
+        "Week": np.char.add("Week ", week.astype(str)).astype(object),
+        # not "Reason for risk": the risk role takes the first header containing "risk"
+        "Reason": reason,
+        "Risk Level": risk,
+        "Intervention": np.array(INTERVENTIONS, dtype=object)[rng.integers(0, len(INTERVENTIONS), rows)],
+        "Lecturer": np.array(["A. Lecturer", "B. Lecturer", "C. Lecturer"], dtype=object)[rng.integers(0, 3, rows)],
+        "Notes": "",
+    })
+    for col in ("Student Name", "Module Code", "Week"):
+        df.loc[rng.random(rows) < 0.005, col] = ""
+    df.iloc[rng.random(rows) < 0.002, :] = ""  # blank rows between blocks
+    return df
+
+
+def to_bytes(df: pd.DataFrame, fmt: str = "csv") -> bytes:
+    """The workbook as an upload of the given format (csv, xlsx or parquet)."""
+    buf = BytesIO()
+    if fmt == "csv":
+        df.to_csv(buf, index=False)
+    elif fmt == "xlsx":
+        df.to_excel(buf, index=False)
+    elif fmt == "parquet":
+        df.to_parquet(buf, index=False)
+    else:
+        raise ValueError(f"Unsupported format: {fmt}")
+    return buf.getvalue()
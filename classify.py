@@ -0,0 +1,147 @@
+import hashlib
+import json
+import os
+import re
+import threading
+
+import numpy as np
+import pandas as pd
+
+# ---------------- classification ----------------
+# Free-text cells the report interprets: is a reason for risk about
+# attendance, how high is a risk level, is a row resolved. Each is a rule set,
+# an ordered list of rules (first match wins) with a default for cells no rule
+# matches. A rule matches a regex (case-insensitive search), any of some
+# words contained in the lower-cased cell, or the whole stripped, lower-cased
+# cell against a list of words.
+#
+# Rule sets run once per distinct value and map back to rows through
+# categorical codes, so their cost follows the number of spellings, not of
+# rows. Results are also remembered per rule set: the weekly workbook brings
+# back the same spellings upload after upload, and only new ones are matched.
+#
+# REPORT_RULES (a JSON file, or the JSON itself) replaces any of the default
+# sets, e.g. to add a risk level:
+#   {"risk": {"default": 0, "label": "Unknown", "rules": [
+#       {"value": 4, "label": "Critical", "contains": ["critical", "black"]},
+#       {"value": 3, "label": "High", "contains": ["high", "red"]}, ...]}}
+
+DEFAULT_RULES = {
+    "attendance": {"default": False, "rules": [
+        {"value": True, "pattern": r"absent|no\s*show|did\s*not\s*attend|not\s*attend|missed\s*class|attendance"},
+    ]},
+    # ranks: the student/module heatmap keeps the highest one seen
+    "risk": {"default": 0, "label": "Unknown", "rules": [
+        {"value": 3, "label": "High", "contains": ["high", "red"]},
+        {"value": 2, "label": "Moderate", "contains": ["med", "amber", "yellow"]},
+        {"value": 1, "label": "Low", "contains": ["low", "green"]},
+    ]},
+    "resolved": {"default": False, "rules": [
+        {"value": True, "words": ["yes", "y", "true", "1", "resolved"]},
+    ]},
+}
+KINDS = {"attendance": np.bool_, "risk": np.int8, "resolved": np.bool_}  # class dtype per set
+MATCHERS = ("pattern", "contains", "words")
+MEMO_SIZE = 100_000  # remembered values per rule set; forgotten all at once past this
+
+
+class RuleSet:
+    """Ordered rules turning cell values into classes, memoized per value."""
+
+    def __init__(self, name: str, spec: dict, dtype):
+        self.name, self.dtype = name, np.dtype(dtype)
+        self.default = self._value(spec.get("default", self.dtype.type(0).item()))  # false / 0
+        self.rules, self.labels = [], {self.default: spec.get("label", str(self.default))}
+        for i, rule in enumerate(spec.get("rules", [])):
+            kinds = [k for k in MATCHERS if k in rule]
+            if len(kinds) != 1:
+                raise ValueError(f"{name} rule {i + 1} needs exactly one of {', '.join(MATCHERS)}")
+            kind, arg = kinds[0], rule[kinds[0]]
+            if kind == "pattern":
+                try:
+                    re.compile(arg)
+                except (re.error, TypeError) as e:
+                    raise ValueError(f"{name} rule {i + 1}: bad pattern: {e}") from None
+            else:
+                arg = [str(w).strip().lower() for w in ([arg] if isinstance(arg, str) else arg)]
+            value = self._value(rule.get("value"))
+            self.labels.setdefault(value, rule.get("label", str(value)))
+            self.rules.append((kind, arg, value))
+        self._memo = {}
+        self._lock = threading.Lock()
+
+    def _value(self, value):
+        if self.dtype == np.bool_:
+            if not isinstance(value, bool):
+                raise ValueError(f"{self.name} classes are true or false, not {value!r}")
+            return value
+        if isinstance(value, bool) or not isinstance(value, int) or not 0 <= value <= np.iinfo(self.dtype).max:
+            raise ValueError(f"{self.name} classes are whole numbers from 0 to {np.iinfo(self.dtype).max}, "
+                             f"not {value!r}")
+        return value
+
+    def _match(self, values: pd.Series) -> np.ndarray:
+        text = values.astype(str)
+        lower = text.str.lower()
+        out = np.full(len(text), self.default, dtype=self.dtype)
+        todo = np.ones(len(text), dtype=bool)
+        for kind, arg, value in self.rules:
+            if kind == "pattern":
+                hit = text.str.contains(arg, flags=re.I, regex=True)
+            elif kind == "contains":
+                hit = pd.Series(False, index=text.index)
+                for w in arg:
+                    hit |= lower.str.contains(w, regex=False)
+            else:
+                hit = lower.str.strip().isin(arg)
+            hit = todo & hit.to_numpy(dtype=bool)
+            out[hit] = value
+            todo &= ~hit
+        return out
+
+    def classes(self, values) -> np.ndarray:
+        """Class of each distinct value; only values not seen before are matched."""
+        keys = [str(v) for v in values]
+        with self._lock:
+            known = [self._memo.get(k) for k in keys]
+        new = [i for i, c in enumerate(known) if c is None]
+        if new:
+            found = self._match(pd.Series([keys[i] for i in new], dtype=object)).tolist()
+            with self._lock:
+                if len(self._memo) + len(new) > MEMO_SIZE:
+                    self._memo.clear()
+                for i, c in zip(new, found):
+                    known[i] = self._memo[keys[i]] = c
+        return np.asarray(known, dtype=self.dtype)
+
+    def __call__(self, series: pd.Series) -> np.ndarray:
+        """Class of every row of series; missing cells get the default."""
+        cat = series if isinstance(series.dtype, pd.CategoricalDtype) else series.astype("category")
+        out = np.full(len(cat.cat.categories) + 1, self.default, dtype=self.dtype)
+        out[:-1] = self.classes(cat.cat.categories)
+        return out[cat.cat.codes.to_numpy()]  # code -1 (missing) picks the trailing slot
+
+
+class Rules:
+    """The attendance, risk and resolved rule sets, with a digest of their spec."""
+
+    def __init__(self, spec: dict = None):
+        spec = dict(DEFAULT_RULES, **(spec or {}))  # sets not given keep their defaults
+        unknown = set(spec) - set(KINDS)
+        if unknown:
+            raise ValueError(f"unknown rule sets: {', '.join(sorted(unknown))} (known: {', '.join(KINDS)})")
+        self.attendance = RuleSet("attendance", spec["attendance"], KINDS["attendance"])
+        self.risk = RuleSet("risk", spec["risk"], KINDS["risk"])
+        self.resolved = RuleSet("resolved", spec["resolved"], KINDS["resolved"])
+        # reports built under other rules are other reports: the digest goes into their cache keys
+        self.digest = hashlib.sha256(json.dumps(spec, sort_keys=True).encode()).hexdigest()[:12]
+
+
+def rules_from_env() -> Rules:
+    source = os.environ.get("REPORT_RULES", "").strip()
+    if not source:
+        return Rules()
+    if source.startswith("{"):
+        return Rules(json.loads(source))
+    with open(source, encoding="utf-8") as fh:
+        return Rules(json.load(fh))
@@ -0,0 +1,103 @@
+import itertools
+from typing import Optional
+
+import numpy as np
+
+from aggregate import Encoded, Groups
+
+# ---------------- filter cube ----------------
+# The module chart can be filtered by week, qualification and risk level, on
+# all records or non-attendance only. Its bars are distinct student counts,
+# which do not add up across cells, so the cube keeps every rollup instead of
+# just the base cells: per-module counts for each combination of filter
+# values, "all" being a value of its own. It is built with the report from
+# the (student, week, module, qualification, risk) table, and answering a
+# filter is a dict lookup plus an array slice.
+
+FILTERS = ("week", "qual", "risk")
+BASES = ("all", "attendance")
+ALL = -1  # filter code of "no filter"
+
+
+class FilterCube:
+    """Per-module student / record counts for every filter combination.
+
+    cells maps (basis, week, qual, risk) codes (ALL = unfiltered) to a
+    [start, stop) range of the module/students/records arrays, ordered by
+    students desc, ties by module name.
+    """
+
+    def __init__(self, labels: dict, modules: list, cells: dict,
+                 module: np.ndarray, students: np.ndarray, records: np.ndarray):
+        self.labels = labels      # filter -> value labels, code = position
+        self.modules = modules
+        self.cells = cells
+        self.module = module
+        self.students = students
+        self.records = records
+        self._codes = {f: {v: i for i, v in enumerate(vals)} for f, vals in labels.items()}
+
+    def __getstate__(self):
+        return {k: v for k, v in self.__dict__.items() if k != "_codes"}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def __len__(self) -> int:
+        return len(self.module)
+
+    @classmethod
+    def of(cls, sid: Encoded, mod: Encoded, filters: dict, rows, att) -> "FilterCube":
+        """filters: FILTERS name -> Encoded, aligned with sid and mod. rows and
+        att are the record and absence counts of each row (a row may stand
+        for several records)."""
+        rows, att = np.asarray(rows), np.asarray(att)
+        cells, parts, size = {}, [], 0
+        for b, basis in enumerate(BASES):
+            mask, weights = (att > 0, att) if basis == "attendance" else (None, rows)
+            for on in itertools.product((False, True), repeat=len(FILTERS)):
+                used = [i for i, keep in enumerate(on) if keep]
+                dims = [filters[FILTERS[i]] for i in used]
+                g = Groups.of(dims + [mod], mask)
+                if not g.n:
+                    continue
+                students, records = g.nunique(sid), g.sum(weights)
+                prefix = np.ravel_multi_index(tuple(g.keys[:-1]), tuple(len(e) for e in dims)) if dims \
+                    else np.zeros(g.n, dtype=np.int64)
+                order = np.lexsort((g.keys[-1], -students, prefix))
+                p = prefix[order]
+                starts = np.flatnonzero(np.r_[True, p[1:] != p[:-1]])
+                stops = np.r_[starts[1:], g.n]
+                heads = [k[order][starts].tolist() for k in g.keys[:-1]]
+                for j, (lo, hi) in enumerate(zip(starts.tolist(), stops.tolist())):
+                    key = [ALL] * len(FILTERS)
+                    for i, k in zip(used, heads):
+                        key[i] = k[j]
+                    cells[(b, *key)] = (size + lo, size + hi)
+                parts.append((g.keys[-1][order], students[order], records[order]))
+                size += g.n
+        cat = (lambda i, dtype: np.concatenate([p[i] for p in parts]).astype(dtype) if parts
+               else np.empty(0, dtype=dtype))
+        labels = {f: list(filters[f].labels) for f in FILTERS}
+        return cls(labels, list(mod.labels), cells, cat(0, np.int32), cat(1, np.int64), cat(2, np.int64))
+
+    def slice(self, filters: dict, basis: str = "all", top: int = 0) -> Optional[dict]:
+        """Modules for one filter combination ("" = all), or None if a filter
+        value is not in the report."""
+        key = [BASES.index(basis)]
+        for f in FILTERS:
+            value = filters.get(f) or ""
+            code = self._codes[f].get(value, None) if value else ALL
+            if code is None:
+                return None
+            key.append(code)
+        lo, hi = self.cells.get(tuple(key), (0, 0))
+        if top:
+            hi = min(hi, lo + top)
+        return {
+            "basis": basis,
+            "filters": {f: filters.get(f) or "" for f in FILTERS},
+            "modules": [self.modules[m] for m in self.module[lo:hi].tolist()],
+            "students": self.students[lo:hi].tolist(),
+            "records": self.records[lo:hi].tolist(),
+        }
@@ -0,0 +1,224 @@
+import csv
+import io
+import math
+import numbers
+import re
+import zipfile
+from typing import Iterable, Iterator, Optional
+from xml.sax.saxutils import escape
+
+from ranking import ranked
+
+# ---------------- exports ----------------
+# Tables staff copy out of the dashboard, as CSV or XLSX. Files are written
+# row by row into a generator, so a download starts with the header and the
+# server holds a chunk at a time, however many rows follow. Rows come from
+# the stored report (rankings, per-student module summaries) or straight from
+# the record store; nothing is rebuilt. An XLSX is a zip of XML parts: sheets
+# use inline strings (no shared-string table to keep in memory) and the zip
+# goes out through data descriptors, since the sizes are not known up front.
+
+FORMATS = {
+    "csv": "text/csv",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+CHUNK = 64 * 1024  # bytes handed to the server at a time
+XLSX_MAX_ROWS = 1_048_576  # rows per sheet in Excel; longer tables go on to more sheets
+XLSX_MAX_TEXT = 32_767  # characters per cell in Excel
+_BATCH = 1000  # rows formatted per write
+
+_ILLEGAL_XML = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]")
+_SHEET_NAME = re.compile(r"[\[\]:*?/\\]")
+
+
+# ---- tables ----
+def _students(report: dict) -> dict:
+    return {s["id"]: s for s in report.get("student_lookup", [])}
+
+
+def top_students(report: dict, module: str = "", qual: str = "", basis: str = "count",
+                 band: str = "") -> Optional[tuple]:
+    """(header, rows) of the cross-module ranking, or of one module's."""
+    ranking = report.get("ranking", {})
+    if module and module not in ranking.get("modules", {}):
+        return None
+    names = _students(report)
+    rows = ((i, r["id"], names.get(r["id"], {}).get("name", ""), r["qual"], r["count"], r["rate"])
+            for i, r in enumerate(ranked(ranking, module, qual, basis, band), 1))
+    return ("rank", "student", "name", "qualification", "absences", "absence_rate"), rows
+
+
+def module_top_students(report: dict, module: str = "", qual: str = "", basis: str = "count",
+                        band: str = "") -> Optional[tuple]:
+    """(header, rows) of every module's ranking (or one module's), one after another."""
+    ranking = report.get("ranking", {})
+    modules = [m for m in report.get("modules", []) if m in ranking.get("modules", {})]
+    if module:
+        if module not in modules:
+            return None
+        modules = [module]
+    names = _students(report)
+    rows = ((m, i, r["id"], names.get(r["id"], {}).get("name", ""), r["qual"], r["count"], r["rate"])
+            for m in modules
+            for i, r in enumerate(ranked(ranking, m, qual, basis, band), 1))
+    return ("module", "rank", "student", "name", "qualification", "absences", "absence_rate"), rows
+
+
+def student_modules(report: dict, student: str = "", module: str = "", qual: str = "") -> Optional[tuple]:
+    """(header, rows) of absences and absence rate per student and module."""
+    summary = report.get("student_module_summary", {})
+    if student:
+        if student not in summary:
+            return None
+        summary = {student: summary[student]}
+    names = _students(report)
+    rows = ((sid, names.get(sid, {}).get("name", ""), names.get(sid, {}).get("qual", ""),
+             m["module"], m["total_absences"], m["rate"])
+            for sid, mods in summary.items()
+            if not qual or names.get(sid, {}).get("qual") == qual
+            for m in mods
+            if not module or m["module"] == module)
+    return ("student", "name", "qualification", "module", "absences", "absence_rate"), rows
+
+
+# name in the URL -> (builder, sheet title, query parameters it takes)
+TABLES = {
+    "top-students": (top_students, "Top students", ("module", "qual", "basis", "band")),
+    "module-top-students": (module_top_students, "Top students by module", ("module", "qual", "basis", "band")),
+    "student-modules": (student_modules, "Student modules", ("student", "module", "qual")),
+}
+
+
+# ---- writers ----
+def csv_stream(header: Iterable, rows: Iterable) -> Iterator[bytes]:
+    """A CSV file in chunks; the first one is the header row."""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    buf.write("\ufeff")  # Excel reads the file as UTF-8 with the BOM only
+    writer.writerow(header)
+    yield buf.getvalue().encode("utf-8")
+    buf.seek(0)
+    buf.truncate()
+    for row in rows:
+        writer.writerow(row)
+        if buf.tell() >= CHUNK:
+            yield buf.getvalue().encode("utf-8")
+            buf.seek(0)
+            buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode("utf-8")
+
+
+class _Sink:
+    """Write-only file for zipfile, drained between chunks. It cannot seek, so
+    zipfile writes each entry's sizes after its data."""
+
+    def __init__(self):
+        self.parts, self.size = [], 0
+
+    def write(self, data) -> int:
+        self.parts.append(bytes(data))
+        self.size += len(data)
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        out = b"".join(self.parts)
+        self.parts, self.size = [], 0
+        return out
+
+
+def _cell(value) -> str:
+    if value is None or isinstance(value, bool):
+        value = "" if value is None else str(value)
+    elif isinstance(value, numbers.Integral):
+        return f"<c><v>{int(value)}</v></c>"
+    elif isinstance(value, numbers.Real):
+        return f"<c><v>{float(value)!r}</v></c>" if math.isfinite(value) else "<c/>"
+    text = _ILLEGAL_XML.sub("", str(value))[:XLSX_MAX_TEXT]
+    if not text:
+        return "<c/>"
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{escape(text)}</t></is></c>'
+
+
+def _row(values) -> str:
+    return "<row>" + "".join(map(_cell, values)) + "</row>"
+
+
+_NS = 'xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"'
+_RELS_NS = 'xmlns="http://schemas.openxmlformats.org/package/2006/relationships"'
+_DOC_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    # every other part is a sheet, so sheets need not be known before they are written
+    '<Default Extension="xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '</Types>'
+)
+_ROOT_RELS = (
+    f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n<Relationships {_RELS_NS}>'
+    f'<Relationship Id="rId1" Type="{_DOC_REL}/officeDocument" Target="xl/workbook.xml"/></Relationships>'
+)
+# header row frozen at the top
+_SHEET_HEAD = (
+    f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n<worksheet {_NS}><sheetViews>'
+    '<sheetView workbookViewId="0"><pane ySplit="1" topLeftCell="A2" activePane="bottomLeft" state="frozen"/>'
+    '</sheetView></sheetViews><sheetData>'
+)
+_SHEET_TAIL = "</sheetData></worksheet>"
+
+
+def _workbook(titles: list) -> tuple:
+    sheets = "".join(f'<sheet name="{escape(t)}" sheetId="{i}" r:id="rId{i}"/>' for i, t in enumerate(titles, 1))
+    rels = "".join(f'<Relationship Id="rId{i}" Type="{_DOC_REL}/worksheet" Target="worksheets/sheet{i}.xml"/>'
+                   for i in range(1, len(titles) + 1))
+    return (
+        f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n<workbook {_NS} xmlns:r="{_DOC_REL}">'
+        f'<sheets>{sheets}</sheets></workbook>',
+        f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n<Relationships {_RELS_NS}>{rels}</Relationships>',
+    )
+
+
+def xlsx_stream(header: Iterable, rows: Iterable, title: str = "Sheet1") -> Iterator[bytes]:
+    """An XLSX workbook in chunks. Past XLSX_MAX_ROWS rows the table goes on
+    in another sheet, under the same header."""
+    header = _row(header)
+    title = _SHEET_NAME.sub(" ", title).strip()[:25] or "Sheet"
+    sink = _Sink()
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("[Content_Types].xml", _CONTENT_TYPES)
+        zf.writestr("_rels/.rels", _ROOT_RELS)
+        yield sink.drain()
+        rows = iter(rows)
+        pending = next(rows, None)
+        titles = []
+        while not titles or pending is not None:
+            titles.append(title if not titles else f"{title} {len(titles) + 1}")
+            with zf.open(f"xl/worksheets/sheet{len(titles)}.xml", "w") as fh:
+                fh.write((_SHEET_HEAD + header).encode("utf-8"))
+                n = 1
+                while pending is not None and n < XLSX_MAX_ROWS:
+                    batch = []
+                    while pending is not None and n < XLSX_MAX_ROWS and len(batch) < _BATCH:
+                        batch.append(_row(pending))
+                        n += 1
+                        pending = next(rows, None)
+                    fh.write("".join(batch).encode("utf-8"))
+                    if sink.size >= CHUNK:
+                        yield sink.drain()
+                fh.write(_SHEET_TAIL.encode("utf-8"))
+        workbook, rels = _workbook(titles)
+        zf.writestr("xl/workbook.xml", workbook)
+        zf.writestr("xl/_rels/workbook.xml.rels", rels)
+    yield sink.drain()
+
+
+def stream(fmt: str, header: Iterable, rows: Iterable, title: str = "Sheet1") -> Iterator[bytes]:
+    if fmt == "xlsx":
+        return xlsx_stream(header, rows, title)
+    return csv_stream(header, rows)
@@ -0,0 +1,212 @@
+import importlib.util
+import multiprocessing
+import multiprocessing.util
+import os
+import tempfile
+import threading
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+# ---------------- ingestion ----------------
+# build_report only looks at a handful of columns, found by name. Reading the
+# header first lets us parse just those columns (as strings) instead of
+# pushing the whole workbook through openpyxl.
+
+SUPPORTED_FORMATS = ("xlsx", "xls", "csv", "parquet")
+EXCEL_FORMATS = ("xlsx", "xls")
+
+# role -> predicate on the lower-cased, stripped header. First match wins,
+# in column order, exactly like the lookups in build_report.
+COLUMN_RULES = {
+    "student":      lambda c: c.startswith("student number"),
+    "name":         lambda c: c.startswith("student name"),
+    "module":       lambda c: c.startswith("module"),
+    "week":         lambda c: c == "week",
+    "reason":       lambda c: "reason" in c,
+    "risk":         lambda c: "risk" in c,
+    "resolved":     lambda c: "resolved" in c,
+    "intervention": lambda c: "intervention" in c,
+    "qual":         lambda c: ("qual" in c or "program" in c or "programme" in c or "course" in c),
+}
+
+
+def _has(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+
+# calamine (Rust) is several times faster than openpyxl and also reads .xls
+EXCEL_ENGINE = "calamine" if _has("python_calamine") else None
+CSV_ENGINE = "pyarrow" if _has("pyarrow") else "c"
+
+
+def file_format(filename: str) -> str:
+    return filename.rsplit(".", 1)[1].lower() if "." in filename else ""
+
+
+def resolve_columns(columns) -> dict:
+    """Map report roles (student, module, week, ...) to column names."""
+    found = {}
+    for c in columns:
+        key = str(c).strip().lower()
+        for role, match in COLUMN_RULES.items():
+            if role not in found and match(key):
+                found[role] = c
+    return found
+
+
+def _projection(columns) -> list:
+    # keep header order so sample rows read naturally
+    wanted = set(resolve_columns(columns).values())
+    return [c for c in columns if c in wanted]
+
+
+# ---------------- readers ----------------
+def _read_excel(content: bytes, parallel: bool = True) -> pd.DataFrame:
+    sheets = pd.ExcelFile(BytesIO(content), engine=EXCEL_ENGINE).sheet_names
+    if len(sheets) > 1:
+        df = _read_sheets(content, sheets, parallel)
+        if df is not None:
+            return df
+    header = pd.read_excel(BytesIO(content), nrows=0, engine=EXCEL_ENGINE)
+    usecols = _projection(list(header.columns))
+    if not usecols:
+        # unknown layout: fall back to a full read so the sample rows still show something
+        return pd.read_excel(BytesIO(content), engine=EXCEL_ENGINE)
+    return pd.read_excel(BytesIO(content), usecols=usecols,
+                         dtype={c: str for c in usecols}, engine=EXCEL_ENGINE)
+
+
+def _read_csv(content: bytes) -> pd.DataFrame:
+    header = pd.read_csv(BytesIO(content), nrows=0)
+    usecols = _projection(list(header.columns))
+    if not usecols:
+        return pd.read_csv(BytesIO(content))
+    return pd.read_csv(BytesIO(content), usecols=usecols,
+                       dtype={c: str for c in usecols}, engine=CSV_ENGINE)
+
+
+def _read_parquet(content: bytes) -> pd.DataFrame:
+    import pyarrow.parquet as pq  # parquet needs pyarrow anyway
+
+    names = pq.read_schema(BytesIO(content)).names
+    usecols = _projection(names) or None
+    return pd.read_parquet(BytesIO(content), columns=usecols)
+
+
+# ---------------- multi-sheet workbooks ----------------
+# Some faculties send a sheet per week or per programme. All sheets of a
+# workbook are parsed side by side in a pool of processes. The data sheets are
+# those whose header has the roles a report is built from (DATA_ROLES), so a
+# cover or notes sheet with a stray "Module" header is not one; of those (or
+# of all sheets, if none has them) the ones laid out like most are stacked in
+# workbook order, with a column naming the sheet each row came from. The
+# names of the sheets left out go into the frame's attrs (SKIPPED_SHEETS).
+
+SHEET_COLUMN = "Sheet"  # matches no role in COLUMN_RULES
+SKIPPED_SHEETS = "skipped_sheets"
+DATA_ROLES = frozenset(("student", "module", "week"))
+PARALLEL_MIN_BYTES = 1024 * 1024  # smaller workbooks read faster than a pool round trip
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def sheet_workers() -> int:
+    return max(1, int(os.environ.get("REPORT_SHEET_WORKERS", os.cpu_count() or 1)))
+
+
+def _read_sheet(source, sheet) -> pd.DataFrame:
+    """One sheet, projected to the columns build_report reads (maybe none)."""
+    # one pass: the fast engines parse the whole sheet even for its header
+    df = pd.read_excel(source, sheet_name=sheet, dtype=str, engine=EXCEL_ENGINE)
+    return df[_projection(list(df.columns))]
+
+
+def _executor() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None or getattr(_pool, "_broken", False):
+            # started on first use, i.e. after gunicorn has forked; spawn, as
+            # forking a threaded web worker can deadlock the child
+            _pool = ProcessPoolExecutor(max_workers=sheet_workers(),
+                                        mp_context=multiprocessing.get_context("spawn"))
+            # in a job pool process, multiprocessing joins child processes at
+            # exit, before atexit hooks run, and closes this pool's queues
+            # (exit priority 10): stop the pool ahead of both
+            multiprocessing.util.Finalize(None, _pool.shutdown, exitpriority=100)
+        return _pool
+
+
+def _read_sheets(content: bytes, sheets: list, parallel: bool = True):
+    """The data sheets laid out like most of them, stacked, or None if no
+    sheet has report columns."""
+    if parallel and sheet_workers() > 1 and len(content) >= PARALLEL_MIN_BYTES:
+        # the pool processes read the workbook from a file rather than
+        # getting a pickled copy of it with every sheet
+        suffix = ".xls" if content[:4] == b"\xd0\xcf\x11\xe0" else ".xlsx"  # OLE2 = legacy .xls
+        with tempfile.NamedTemporaryFile(suffix=suffix) as fh:
+            fh.write(content)
+            fh.flush()
+            pool = _executor()
+            futures = [pool.submit(_read_sheet, fh.name, name) for name in sheets]
+            frames = [f.result() for f in futures]
+    else:
+        frames = [_read_sheet(BytesIO(content), name) for name in sheets]
+
+    roles = {name: frozenset(resolve_columns(f.columns)) for name, f in zip(sheets, frames) if len(f.columns)}
+    if not roles:
+        return None
+    layouts = Counter(r for r in roles.values() if DATA_ROLES <= r) or Counter(roles.values())
+    layout = max(layouts, key=layouts.get)  # the first sheet's layout on ties
+    keep = [(name, f) for name, f in zip(sheets, frames) if roles.get(name) == layout]
+    skipped = [str(name) for name in sheets if roles.get(name) != layout]
+    if len(keep) == 1:
+        df = keep[0][1]
+        df.attrs[SKIPPED_SHEETS] = skipped
+        return df
+
+    # one column per header, under the first sheet's names: matched by name up
+    # to case and padding, else by role ("Module" -> "Module Code")
+    frames = [f for _, f in keep]
+    names = {str(c).strip().lower(): c for c in frames[0].columns}
+    first = resolve_columns(frames[0].columns)
+    for frame in frames[1:]:
+        rename = {c: names[str(c).strip().lower()] for c in frame.columns if str(c).strip().lower() in names}
+        for role, c in resolve_columns(frame.columns).items():
+            target = first.get(role)
+            if c not in rename and target is not None and target not in rename.values():
+                rename[c] = target
+        frame.rename(columns=rename, inplace=True)
+    df = pd.concat(frames, ignore_index=True, sort=False)
+    codes = np.repeat(np.arange(len(frames)), [len(f) for f in frames])
+    df[SHEET_COLUMN] = pd.Categorical.from_codes(codes, categories=[str(name) for name, _ in keep])
+    df.attrs[SKIPPED_SHEETS] = skipped
+    return df
+
+
+READERS = {
+    "xlsx": _read_excel,
+    "xls": _read_excel,
+    "csv": _read_csv,
+    "parquet": _read_parquet,
+}
+
+
+def read_upload(content: bytes, filename: str, parallel: bool = True) -> pd.DataFrame:
+    """Parse an uploaded file, projecting to the columns build_report reads.
+
+    The sheets of a multi-sheet workbook are read in a pool of
+    REPORT_SHEET_WORKERS processes (default: one per CPU) unless parallel
+    is False.
+    """
+    fmt = file_format(filename)
+    reader = READERS.get(fmt)
+    if reader is None:
+        raise ValueError(f"Unsupported file type: .{fmt}")
+    if fmt in EXCEL_FORMATS:
+        return reader(content, parallel)
+    return reader(content)
@@ -0,0 +1,287 @@
+import cProfile
+import io
+import os
+import pstats
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Optional
+
+from flask import Response, abort, g, has_request_context, request
+
+# ---------------- instrumentation ----------------
+# Report builds report their stages through a progress hook (the one
+# background jobs use for their progress bar). StageTimer is such a hook: it
+# records wall time, rows going in, the change in resident memory and the
+# peak resident memory of each stage. A request's stages go out in a
+# Server-Timing header, which browsers show in the network panel, and into
+# histograms served at /metrics in the Prometheus text format. Metrics are
+# per process: with several gunicorn workers, each scrape sees the worker
+# that answered it.
+# With REPORT_PROFILE=1, adding ?profile=1 to a request also runs it under
+# cProfile; the X-Profile header links to the result.
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+BYTES_BUCKETS = tuple(m * 1024 * 1024 for m in (-64, -1, 0, 1, 8, 32, 128, 512, 2048))
+PEAK_BUCKETS = tuple(m * 1024 * 1024 for m in (64, 128, 256, 512, 768, 1024, 1536, 2048, 4096))
+MAX_PROFILES = 20  # most recent request profiles kept in memory
+PROFILE_LINES = 60
+
+try:
+    _PAGE = os.sysconf("SC_PAGE_SIZE")
+except (AttributeError, ValueError, OSError):
+    _PAGE = 4096
+
+
+def _rss() -> Optional[int]:
+    """Resident memory of this process in bytes (Linux), None elsewhere."""
+    try:
+        with open("/proc/self/statm", "rb") as fh:
+            return int(fh.read().split()[1]) * _PAGE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _peak_rss(reset: bool = False) -> Optional[int]:
+    """High-water mark of resident memory in bytes (Linux), None elsewhere.
+
+    reset starts a new high-water mark (Linux 4.0+). It is per process, so
+    stages of requests running side by side in threads share it.
+    """
+    try:
+        if reset:
+            with open("/proc/self/clear_refs", "w") as fh:
+                fh.write("5")
+            return None
+        with open("/proc/self/status", "rb") as fh:
+            for line in fh:
+                if line.startswith(b"VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+class StageTimer:
+    """Progress hook recording wall time, input rows and memory per stage.
+
+    Call it with a stage name (and the rows the stage works on) when a stage
+    starts; the previous stage ends there. stop() ends the last one.
+    """
+
+    def __init__(self):
+        self.stages = []  # {"stage", "seconds", "rows", "memory_delta", "memory_peak"}
+        self._open = None
+
+    def __call__(self, stage: str, rows: Optional[int] = None) -> None:
+        self.stop()
+        _peak_rss(reset=True)
+        self._open = (stage, rows, time.perf_counter(), _rss())
+
+    def stop(self) -> None:
+        if self._open is None:
+            return
+        stage, rows, t0, rss0 = self._open
+        self._open = None
+        rss1, peak = _rss(), _peak_rss()
+        self.stages.append({
+            "stage": stage,
+            "seconds": round(time.perf_counter() - t0, 6),
+            "rows": None if rows is None else int(rows),
+            "memory_delta": None if rss0 is None or rss1 is None else rss1 - rss0,
+            "memory_peak": peak,
+        })
+
+    def server_timing(self, total: Optional[float] = None) -> str:
+        parts = []
+        for s in self.stages:
+            desc = []
+            if s["rows"] is not None:
+                desc.append(f"{s['rows']} rows")
+            if s["memory_delta"] is not None:
+                desc.append(f"{s['memory_delta'] / 1048576:+.1f}MB")
+            if s.get("memory_peak") is not None:
+                desc.append(f"peak {s['memory_peak'] / 1048576:.0f}MB")
+            entry = f"{s['stage']};dur={s['seconds'] * 1000:.1f}"
+            parts.append(entry + (f';desc="{", ".join(desc)}"' if desc else ""))
+        if total is not None:
+            parts.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(parts)
+
+
+# ---- metrics ----
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _labels(names: tuple, values: tuple, le: Optional[str] = None) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if le is not None:
+        pairs.append(f'le="{le}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self.values = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = tuple(labels.get(n, "") for n in self.labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self) -> list:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, v in sorted(self.values.items()):
+            out.append(f"{self.name}{_labels(self.labels, key)} {_number(v)}")
+        return out
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: tuple, labels: tuple = ()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self.series = {}  # label values -> [per-bucket counts..., +Inf count, sum]
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(labels.get(n, "") for n in self.labels)
+        s = self.series.setdefault(key, [0] * (len(self.buckets) + 1) + [0.0])
+        for i, b in enumerate(self.buckets):
+            if value <= b:
+                s[i] += 1
+        s[len(self.buckets)] += 1
+        s[-1] += value
+
+    def render(self) -> list:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, s in sorted(self.series.items()):
+            for b, n in zip(self.buckets, s):
+                out.append(f"{self.name}_bucket{_labels(self.labels, key, _number(b))} {n}")
+            count = s[len(self.buckets)]
+            out.append(f"{self.name}_bucket{_labels(self.labels, key, '+Inf')} {count}")
+            out.append(f"{self.name}_sum{_labels(self.labels, key)} {_number(s[-1])}")
+            out.append(f"{self.name}_count{_labels(self.labels, key)} {count}")
+        return out
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        self.lock = threading.Lock()
+
+    def add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        with self.lock:
+            lines = [line for m in self.metrics for line in m.render()]
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Registry()
+STAGE_SECONDS = METRICS.add(Histogram(
+    "soit_stage_seconds", "Wall time of report pipeline stages.", SECONDS_BUCKETS, ("stage", "source")))
+STAGE_ROWS = METRICS.add(Counter(
+    "soit_stage_rows_total", "Rows going into report pipeline stages.", ("stage", "source")))
+STAGE_MEMORY = METRICS.add(Histogram(
+    "soit_stage_memory_delta_bytes", "Change in resident memory across a pipeline stage.",
+    BYTES_BUCKETS, ("stage", "source")))
+STAGE_PEAK = METRICS.add(Histogram(
+    "soit_stage_memory_peak_bytes", "Peak resident memory during a pipeline stage.",
+    PEAK_BUCKETS, ("stage", "source")))
+REQUEST_SECONDS = METRICS.add(Histogram(
+    "soit_request_seconds", "Wall time of HTTP requests.", SECONDS_BUCKETS, ("endpoint", "method", "status")))
+
+
+def observe_stages(stages: list, source: str = "web") -> None:
+    """Add finished stages (StageTimer.stages) to the stage metrics."""
+    with METRICS.lock:
+        for s in stages or ():
+            STAGE_SECONDS.observe(s["seconds"], stage=s["stage"], source=source)
+            if s.get("rows") is not None:
+                STAGE_ROWS.inc(s["rows"], stage=s["stage"], source=source)
+            if s.get("memory_delta") is not None:
+                STAGE_MEMORY.observe(s["memory_delta"], stage=s["stage"], source=source)
+            if s.get("memory_peak") is not None:
+                STAGE_PEAK.observe(s["memory_peak"], stage=s["stage"], source=source)
+
+
+# ---- flask glue ----
+def stage(name: str, rows: Optional[int] = None) -> None:
+    """Progress hook for code running in a request: times it on that request."""
+    timer = g.get("_stages") if has_request_context() else None
+    if timer is not None:
+        timer(name, rows)
+
+
+class _Profiles:
+    def __init__(self, size: int = MAX_PROFILES):
+        self.size = size
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def add(self, profiler: cProfile.Profile, label: str) -> str:
+        buf = io.StringIO()
+        buf.write(label + "\n\n")
+        pstats.Stats(profiler, stream=buf).sort_stats("cumulative").print_stats(PROFILE_LINES)
+        pid = uuid.uuid4().hex[:16]
+        with self.lock:
+            self.items[pid] = buf.getvalue()
+            while len(self.items) > self.size:
+                self.items.popitem(last=False)
+        return pid
+
+    def get(self, pid: str) -> Optional[str]:
+        with self.lock:
+            return self.items.get(pid)
+
+
+def init_app(app, profile: Optional[bool] = None) -> None:
+    """Time every request, emit Server-Timing and serve /metrics."""
+    if profile is None:
+        profile = os.environ.get("REPORT_PROFILE", "").lower() in ("1", "true", "yes")
+    profiles = _Profiles()
+
+    @app.before_request
+    def _start():
+        g._stages = StageTimer()
+        g._started = time.perf_counter()
+        if profile and request.args.get("profile"):
+            g._profiler = cProfile.Profile()
+            g._profiler.enable()
+
+    @app.after_request
+    def _finish(resp):
+        timer = g.pop("_stages", None)
+        if timer is None:
+            return resp
+        timer.stop()
+        total = time.perf_counter() - g.pop("_started")
+        profiler = g.pop("_profiler", None)
+        if profiler is not None:
+            profiler.disable()
+            resp.headers["X-Profile"] = "/debug/profiles/" + profiles.add(profiler, f"{request.method} {request.full_path}")
+        resp.headers["Server-Timing"] = timer.server_timing(total)
+        observe_stages(timer.stages)
+        with METRICS.lock:
+            REQUEST_SECONDS.observe(total, endpoint=request.endpoint or "unmatched",
+                                    method=request.method, status=resp.status_code)
+        return resp
+
+    @app.route("/metrics", methods=["GET"])
+    def metrics():
+        return Response(METRICS.render(), mimetype="text/plain; version=0.0.4")
+
+    if profile:
+        @app.route("/debug/profiles/<pid>", methods=["GET"])
+        def show_profile(pid):
+            text = profiles.get(pid)
+            if text is None:
+                abort(404)
+            return Response(text, mimetype="text/plain")
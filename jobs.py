@@ -0,0 +1,231 @@
+import json
+import multiprocessing
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+from instrument import StageTimer, observe_stages
+from report_cache import DATA_DIR, private_dir
+
+# ---------------- background report jobs ----------------
+# In job mode an upload gets a job id straight away and the report is built in
+# a small process pool, so a large workbook no longer holds a web worker for
+# the whole parse. Job state lives in JSON files: whichever gunicorn worker
+# gets a poll can answer it, and cancelling is a flag file the build checks
+# between stages.
+
+JOB_RE = re.compile(r"[0-9a-f]{32}")
+TERMINAL = ("done", "failed", "cancelled")
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class QueueFull(Exception):
+    pass
+
+
+class JobStore:
+    """Job state files, shared by the web workers and the pool processes."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        private_dir(directory)  # job states are trusted as found: nobody else may write here
+
+    def _path(self, job_id: str, suffix: str = ".json") -> str:
+        return os.path.join(self.directory, job_id + suffix)
+
+    def read(self, job_id: str) -> Optional[dict]:
+        if not JOB_RE.fullmatch(job_id or ""):
+            return None  # ids come from URLs: never build paths from anything else
+        try:
+            with open(self._path(job_id), encoding="utf-8") as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return None
+
+    def write(self, job_id: str, state: dict) -> None:
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as fh:
+            json.dump(state, fh)
+        os.replace(tmp, self._path(job_id))  # pollers never see half-written state
+
+    def update(self, job_id: str, **changes) -> dict:
+        state = self.read(job_id) or {"id": job_id}
+        state.update(changes)
+        self.write(job_id, state)
+        return state
+
+    def request_cancel(self, job_id: str) -> None:
+        with open(self._path(job_id, ".cancel"), "w"):
+            pass
+
+    def cancel_requested(self, job_id: str) -> bool:
+        return os.path.exists(self._path(job_id, ".cancel"))
+
+    def prune(self, max_age: float) -> None:
+        """Drop state of jobs that finished more than max_age seconds ago."""
+        now = time.time()
+        try:
+            entries = list(os.scandir(self.directory))
+        except OSError:
+            return
+        for e in entries:
+            try:
+                if now - e.stat().st_mtime > max_age:
+                    os.remove(e.path)
+            except OSError:
+                continue
+
+
+def _run_job(directory: str, job_id: str, stages: tuple, fn, args: tuple) -> None:
+    """Runs in a pool process: fn(*args, progress=...) with state updates."""
+    store = JobStore(directory)
+    started = time.time()
+    timer = StageTimer()
+
+    def progress(stage: str, rows: Optional[int] = None) -> None:
+        if store.cancel_requested(job_id):
+            raise JobCancelled()
+        timer(stage, rows)
+        step = stages.index(stage) + 1 if stage in stages else None
+        store.update(job_id, status="running", stage=stage, step=step)
+
+    try:
+        if store.cancel_requested(job_id):
+            raise JobCancelled()
+        store.update(job_id, status="running", started=started)
+        result = fn(*args, progress=progress)
+    except JobCancelled:
+        store.update(job_id, status="cancelled", finished=time.time())
+    except Exception as e:
+        store.update(job_id, status="failed", error=str(e), finished=time.time())
+    else:
+        timer.stop()
+        store.update(job_id, status="done", stage=None, step=len(stages), result=result, timings=timer.stages,
+                     finished=time.time(), seconds=round(time.time() - started, 3))
+
+
+class JobManager:
+    """Bounded process pool for report builds, with a bounded queue in front.
+
+    Limits are per web worker process: at most max_workers builds run at once
+    and at most max_queue more wait; further submissions raise QueueFull.
+    """
+
+    def __init__(self, directory: str, max_workers: int = 2, max_queue: int = 8,
+                 max_age: float = 24 * 3600):
+        self.store = JobStore(directory)
+        self.max_workers = max(1, int(max_workers))
+        self.max_queue = max(0, int(max_queue))
+        self.max_age = float(max_age)
+        self._pool = None  # started on first use, i.e. after gunicorn has forked
+        self._active = {}  # job_id -> Future, for jobs submitted by this process
+        self._lock = threading.Lock()
+
+    # ---- public API ----
+    def submit(self, fn, *args, stages: tuple = ()) -> str:
+        with self._lock:
+            if len(self._active) >= self.max_workers + self.max_queue:
+                raise QueueFull(f"{len(self._active)} report jobs are already queued or running.")
+            self.store.prune(self.max_age)
+            job_id = uuid.uuid4().hex
+            self.store.write(job_id, {"id": job_id, "status": "queued", "stage": None, "step": 0,
+                                      "steps": len(stages), "created": time.time()})
+            fut = self._executor().submit(_run_job, self.store.directory, job_id, tuple(stages), fn, args)
+            self._active[job_id] = fut
+        fut.add_done_callback(lambda f, job_id=job_id: self._finished(job_id, f))
+        return job_id
+
+    def status(self, job_id: str) -> Optional[dict]:
+        state = self.store.read(job_id)
+        if state is None or state.get("status") in TERMINAL:
+            return state
+        # only the pool process writes a started job's state; the flag is separate
+        state["cancel_requested"] = self.store.cancel_requested(job_id)
+        if state.get("status") == "queued":
+            with self._lock:
+                queued = [j for j in self._active if self._state_of(j) == "queued"]
+            if job_id in queued:
+                state["position"] = queued.index(job_id) + 1
+        return state
+
+    def cancel(self, job_id: str) -> Optional[dict]:
+        state = self.store.read(job_id)
+        if state is None or state.get("status") in TERMINAL:
+            return state
+        self.store.request_cancel(job_id)
+        with self._lock:
+            fut = self._active.get(job_id)
+        if fut is not None and fut.cancel():
+            # never started: nothing in the pool will mark it
+            return self.store.update(job_id, status="cancelled", finished=time.time())
+        return self.status(job_id)
+
+    def events(self, job_id: str, interval: float = 0.5):
+        """Yield the job state whenever it changes, until it is finished."""
+        last = None
+        while True:
+            state = self.status(job_id)
+            if state != last:
+                yield state
+                last = state
+            if state is None or state.get("status") in TERMINAL:
+                return
+            time.sleep(interval)
+
+    def stats(self) -> dict:
+        with self._lock:
+            states = [self._state_of(j) for j in self._active]
+        return {
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "running": states.count("running"),
+            "queued": states.count("queued"),
+            "accepting": len(states) < self.max_workers + self.max_queue,
+        }
+
+    # ---- internals ----
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: forking a threaded web worker can deadlock the child
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers,
+                                             mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    def _state_of(self, job_id: str) -> Optional[str]:
+        state = self.store.read(job_id)
+        return state.get("status") if state else None
+
+    def _finished(self, job_id: str, fut) -> None:
+        with self._lock:
+            self._active.pop(job_id, None)
+        if fut.cancelled():
+            return
+        state = self.store.read(job_id) or {}
+        if state.get("status") == "done":
+            observe_stages(state.get("timings"), source="job")
+        err = fut.exception()
+        if err is not None and self._state_of(job_id) not in TERMINAL:
+            # the pool process died (e.g. out of memory) before recording anything
+            self.store.update(job_id, status="failed", error=str(err) or type(err).__name__,
+                              finished=time.time())
+            with self._lock:
+                if getattr(self._pool, "_broken", False):
+                    self._pool = None
+
+
+def jobs_from_env() -> JobManager:
+    directory = os.environ.get("REPORT_JOB_DIR", os.path.join(DATA_DIR, "report-jobs"))
+    return JobManager(
+        directory=directory,
+        max_workers=int(os.environ.get("REPORT_JOB_WORKERS", 2)),
+        max_queue=int(os.environ.get("REPORT_JOB_QUEUE", 8)),
+        max_age=float(os.environ.get("REPORT_JOB_MAX_AGE_HOURS", 24)) * 3600,
+    )
@@ -0,0 +1,114 @@
+import numpy as np
+import pandas as pd
+
+from classify import Rules
+
+# ---------------- normalization ----------------
+# Runs once, before aggregation. Every derived value (canonical student id,
+# qualification, risk rank, "is this cell filled in") is computed per
+# distinct value with vectorized string ops and mapped back to rows through
+# categorical codes, so nothing downstream calls a Python function per row.
+
+QUAL_ALIASES = {"BBIS-B": "BBIS", "BITW-B": "BITW", "HCS-B": "HCS"}
+
+# columns normalize_frame adds next to the uploaded ones
+DERIVED_COLUMNS = ("_sid", "_qual", "_risk_rank")
+
+
+def intern(series: pd.Series) -> pd.Series:
+    """Categorical version of a column holding only the observed values."""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series.cat.remove_unused_categories()
+    return series.astype("category")
+
+
+def _per_category(series: pd.Series, fn, missing, dtype) -> np.ndarray:
+    """Evaluate fn on the distinct values of series and broadcast back to rows."""
+    cat = intern(series)
+    out = np.full(len(cat.cat.categories) + 1, missing, dtype=dtype)
+    out[:-1] = fn(pd.Series(cat.cat.categories))
+    return out[cat.cat.codes.to_numpy()]  # code -1 (missing) picks the trailing slot
+
+
+def _recode(series: pd.Series, fn, missing=None) -> pd.Series:
+    """Categorical of fn(value) per row; values that collide after fn are merged."""
+    cat = intern(series)
+    labels = list(fn(pd.Series(cat.cat.categories)))
+    codes = cat.cat.codes.to_numpy()
+    if missing is not None:
+        labels.append(missing)
+        codes = np.where(codes >= 0, codes, len(labels) - 1)
+    if not labels:
+        return pd.Series(pd.Categorical([None] * len(codes)), index=series.index)
+    new_codes, uniques = pd.factorize(np.asarray(labels, dtype=object), sort=True)
+    out = np.where(codes >= 0, new_codes[np.maximum(codes, 0)], -1)
+    recoded = pd.Categorical.from_codes(out, categories=uniques)
+    return pd.Series(recoded, index=series.index).cat.remove_unused_categories()
+
+
+def strip_text(series: pd.Series) -> pd.Series:
+    """Categorical of the stripped cells of a text column; blank cells become missing.
+
+    Strips each distinct value once instead of building a new string per row,
+    and never turns NaN into the text "nan" the way astype(str) does.
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        codes, uniques = series.cat.codes.to_numpy(), series.cat.categories
+    else:
+        codes, uniques = pd.factorize(series)
+    text = pd.Series(uniques, dtype=object).astype(str).str.strip()
+    new_codes, labels = pd.factorize(text.mask(text == ""), sort=True)
+    out = np.where(codes >= 0, new_codes[np.maximum(codes, 0)], -1) if len(new_codes) else np.full(len(codes), -1)
+    return pd.Series(pd.Categorical.from_codes(out, categories=pd.Index(labels, dtype=object)),
+                     index=series.index, name=series.name)
+
+
+# ---------------- vectorized helpers (operate on distinct values) ----------------
+def _canon_ids(values: pd.Series) -> pd.Series:
+    # 123.0 -> "123" for numeric columns, "123.0 " -> "123" for text ones
+    if pd.api.types.is_float_dtype(values):
+        f = values.to_numpy(dtype=float)
+        whole = np.isfinite(f) & (f == np.floor(f))
+        as_int = np.where(whole, f, 0).astype(np.int64).astype(str)
+        return pd.Series(np.where(whole, as_int, values.astype(str).to_numpy()), dtype=object)
+    return values.astype(str).str.strip().str.replace(r"\.0+$", "", regex=True)
+
+
+def _canon_quals(values: pd.Series) -> pd.Series:
+    s = values.astype(str).str.strip().str.upper().replace(QUAL_ALIASES)
+    return s.mask(s == "", "Unknown")
+
+
+def _filled(values: pd.Series) -> np.ndarray:
+    return (~values.astype(str).str.strip().isin(["", "nan"])).to_numpy(dtype=bool)
+
+
+def nonempty(series: pd.Series) -> np.ndarray:
+    """Row mask: cell holds something other than blank/NaN/'nan'."""
+    return _per_category(series, _filled, False, bool)
+
+
+# ---------------- stage ----------------
+def normalize_frame(df: pd.DataFrame, cols: dict, rules: Rules = None) -> pd.DataFrame:
+    """Intern report columns as categoricals and add _sid, _qual, _risk_rank.
+
+    `cols` maps roles (student, module, week, ...) to column names, as
+    returned by ingest.resolve_columns; risk ranks come from rules (see
+    classify.py). The frame is modified in place.
+    """
+    for role, c in cols.items():
+        if role == "week":
+            df[c] = _recode(df[c], lambda v: v.astype(str))
+        elif role == "student":
+            df["_sid"] = _recode(df[c], _canon_ids)
+            df[c] = intern(df[c])
+        else:
+            df[c] = intern(df[c])
+
+    if cols.get("qual"):
+        df["_qual"] = _recode(df[cols["qual"]], _canon_quals, missing="Unknown")
+    else:
+        df["_qual"] = pd.Categorical(["Unknown"] * len(df))
+    if cols.get("risk"):
+        df["_risk_rank"] = (rules or Rules()).risk(df[cols["risk"]])
+    return df
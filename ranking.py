@@ -0,0 +1,50 @@
+import numpy as np
+
+# ---------------- ranking ----------------
+# Top-student lists for every module and the cross-module list are ranked in
+# a single sort over (partition, -count, -rate, student). The page only gets
+# the first TOP_K of each list; the rest is paged in on request.
+
+TOP_K = 20
+GLOBAL = -1  # partition code of the cross-module list
+
+# same bands as the "Rate band" filter in the dashboard
+RATE_BANDS = {"low": (None, 39), "moderate": (40, 69), "high": (70, None)}
+BASES = ("count", "rate")
+
+
+def rank_partitions(parts, students, counts, rates) -> dict:
+    """Row indices per partition code, best first (ties by student code)."""
+    parts = np.asarray(parts)
+    if not len(parts):
+        return {}
+    order = np.lexsort((np.asarray(students), -np.asarray(rates), -np.asarray(counts), parts))
+    p = parts[order]
+    cuts = np.flatnonzero(p[1:] != p[:-1]) + 1
+    return {int(seg[0]): idx for seg, idx in zip(np.split(p, cuts), np.split(order, cuts))}
+
+
+def _in_band(rate: float, band: str) -> bool:
+    lo, hi = RATE_BANDS.get(band, (None, None))
+    return (lo is None or rate >= lo) and (hi is None or rate <= hi)
+
+
+def ranked(ranking: dict, module: str = "", qual: str = "", basis: str = "count", band: str = "") -> list:
+    """A ranked list (one module's, or the cross-module one), filtered by qualification and rate band."""
+    rows = ranking.get("modules", {}).get(module, []) if module else ranking.get("global", [])
+    if qual:
+        rows = [r for r in rows if r["qual"] == qual]
+    if band in RATE_BANDS:
+        rows = [r for r in rows if _in_band(float(r["rate"]), band)]
+    if basis == "rate":
+        rows = sorted(rows, key=lambda r: -r["rate"])  # stable: count order breaks ties
+    return rows
+
+
+def page(ranking: dict, module: str = "", qual: str = "", basis: str = "count",
+         band: str = "", offset: int = 0, limit: int = TOP_K) -> dict:
+    """One page of a ranked list, filtered by qualification and rate band."""
+    rows = ranked(ranking, module, qual, basis, band)
+    offset = max(0, int(offset))
+    limit = max(0, int(limit))
+    return {"total": len(rows), "offset": offset, "limit": limit, "items": rows[offset:offset + limit]}
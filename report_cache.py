@@ -0,0 +1,226 @@
+import hashlib
+import os
+import pickle
+import re
+import stat
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+# ---------------- report cache ----------------
+# Reports are keyed by a hash of the uploaded bytes plus the report version,
+# so re-uploading the same workbook skips parsing and aggregation entirely.
+# A small in-process LRU sits in front of a directory every gunicorn worker
+# can read, which lets one worker reuse a report another worker built.
+
+SUFFIX = ".pkl"
+KEY_RE = re.compile(r"[0-9a-f]{64}")
+# default home of the cache (and of job state and the record store): a
+# directory of the app's own, not a guessable path in the shared temp dir
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "instance")
+
+
+def private_dir(path: str) -> str:
+    """Create path (mode 0700) if missing; refuse it unless it is a directory
+    of this user's that no one else can write to. Files in it are trusted."""
+    if not os.path.isdir(path):
+        parent = os.path.dirname(os.path.abspath(path))
+        if not os.path.isdir(parent):
+            private_dir(parent)  # makedirs would leave missing parents open to the umask
+        try:
+            os.mkdir(path, 0o700)
+        except FileExistsError:
+            pass
+    st = os.stat(path)
+    if not stat.S_ISDIR(st.st_mode):
+        raise NotADirectoryError(path)
+    if hasattr(os, "geteuid") and st.st_uid != os.geteuid():
+        raise PermissionError(f"{path} belongs to another user; refusing to use it")
+    if st.st_mode & 0o022:
+        raise PermissionError(f"{path} is writable by other users; chmod 700 it first")
+    return path
+
+
+def cache_key(content: bytes, version: str, *parts: str) -> str:
+    """Content hash of an upload, salted with the report version."""
+    h = hashlib.sha256()
+    for p in (version, *parts):
+        h.update(str(p).encode("utf-8"))
+        h.update(b"\0")
+    h.update(content)
+    return h.hexdigest()
+
+
+class ReportCache:
+    def __init__(self, directory: Optional[str], max_items: int = 8,
+                 max_bytes: int = 512 * 1024 * 1024, max_age: float = 7 * 24 * 3600):
+        self.directory = directory
+        self.max_items = max(0, int(max_items))
+        self.max_bytes = max(0, int(max_bytes))
+        self.max_age = float(max_age)
+        self._mem = OrderedDict()  # key -> (stored_at, report)
+        self._lock = threading.Lock()
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        if directory:
+            # reports hold student data and are unpickled on read: keep the dir private
+            private_dir(directory)
+
+    # ---- public API ----
+    def get(self, key: str) -> Optional[dict]:
+        if not KEY_RE.fullmatch(key or ""):
+            return None  # keys come from URLs too: never build paths from anything else
+        now = time.time()
+        with self._lock:
+            hit = self._mem.get(key)
+            if hit is not None:
+                stored_at, report = hit
+                if now - stored_at <= self.max_age:
+                    self._mem.move_to_end(key)
+                    self.counters["memory_hits"] += 1
+                    return report
+                del self._mem[key]
+                self.counters["evictions"] += 1
+
+        report = self._disk_get(key, now)
+        with self._lock:
+            if report is None:
+                self.counters["misses"] += 1
+                return None
+            self.counters["disk_hits"] += 1
+            self._mem_put(key, report, now)
+        return report
+
+    def has(self, key: str) -> bool:
+        """Whether get(key) would find a report, without loading it."""
+        if not KEY_RE.fullmatch(key or ""):
+            return False
+        now = time.time()
+        with self._lock:
+            hit = self._mem.get(key)
+            if hit is not None and now - hit[0] <= self.max_age:
+                return True
+        if not self.directory:
+            return False
+        try:
+            return now - os.path.getmtime(self._path(key)) <= self.max_age
+        except OSError:
+            return False
+
+    def put(self, key: str, report: dict) -> None:
+        now = time.time()
+        with self._lock:
+            self._mem_put(key, report, now)
+            self.counters["stores"] += 1
+        self._disk_put(key, report)
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = dict(self.counters)
+            out["memory_items"] = len(self._mem)
+        lookups = out["memory_hits"] + out["disk_hits"] + out["misses"]
+        out["hit_rate"] = round((out["memory_hits"] + out["disk_hits"]) / lookups, 3) if lookups else 0.0
+        files = self._disk_files()
+        out["disk_items"] = len(files)
+        out["disk_bytes"] = int(sum(size for _, size, _ in files))
+        return out
+
+    # ---- memory tier ----
+    def _mem_put(self, key: str, report: dict, now: float) -> None:
+        if not self.max_items:
+            return
+        self._mem[key] = (now, report)
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_items:
+            self._mem.popitem(last=False)
+            self.counters["evictions"] += 1
+
+    # ---- disk tier ----
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + SUFFIX)
+
+    def _disk_get(self, key: str, now: float) -> Optional[dict]:
+        if not self.directory:
+            return None
+        path = self._path(key)
+        try:
+            if now - os.path.getmtime(path) > self.max_age:
+                self._remove(path)
+                return None
+            with open(path, "rb") as fh:
+                if hasattr(os, "geteuid") and os.fstat(fh.fileno()).st_uid != os.geteuid():
+                    return None  # not written by this app: never unpickle it
+                report = pickle.load(fh)
+            os.utime(path)  # mtime doubles as last-used time for disk eviction
+            return report
+        except FileNotFoundError:
+            return None
+        except Exception:
+            # truncated or stale file: drop it and rebuild
+            self._remove(path)
+            return None
+
+    def _disk_put(self, key: str, report: dict) -> None:
+        if not self.directory:
+            return
+        try:
+            fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "wb") as fh:
+                pickle.dump(report, fh, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, self._path(key))  # atomic, so other workers never see partial files
+        except OSError:
+            return
+        self._disk_evict()
+
+    def _disk_files(self) -> list:
+        if not self.directory:
+            return []
+        out = []
+        try:
+            entries = list(os.scandir(self.directory))
+        except OSError:
+            return []
+        for e in entries:
+            if not e.name.endswith(SUFFIX):
+                continue
+            try:
+                st = e.stat()
+            except OSError:
+                continue
+            out.append((e.path, st.st_size, st.st_mtime))
+        return out
+
+    def _disk_evict(self) -> None:
+        now = time.time()
+        files = []
+        for path, size, mtime in self._disk_files():
+            if now - mtime > self.max_age:
+                self._remove(path)
+            else:
+                files.append((path, size, mtime))
+        total = sum(size for _, size, _ in files)
+        # least recently used first
+        for path, size, _ in sorted(files, key=lambda x: x[2]):
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    def _remove(self, path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            return
+        with self._lock:
+            self.counters["evictions"] += 1
+
+
+def cache_from_env() -> ReportCache:
+    directory = os.environ.get("REPORT_CACHE_DIR", os.path.join(DATA_DIR, "report-cache"))
+    return ReportCache(
+        directory=directory or None,
+        max_items=int(os.environ.get("REPORT_CACHE_ITEMS", 8)),
+        max_bytes=int(float(os.environ.get("REPORT_CACHE_MAX_MB", 512)) * 1024 * 1024),
+        max_age=float(os.environ.get("REPORT_CACHE_MAX_AGE_HOURS", 24 * 7)) * 3600,
+    )
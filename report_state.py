@@ -0,0 +1,111 @@
+import numpy as np
+import pandas as pd
+
+from aggregate import Encoded, Groups, ordered_counts
+
+# ---------------- mergeable report state ----------------
+# Everything build_report shows is a function of a few aggregate tables:
+# row / absence counts and the max risk rank per (student, module, week),
+# counts per (student, week, risk), name and qualification counts per
+# student, and so on. A week's rows are summarized into the same tables and
+# merge() folds them into the stored state of the previous report, so an
+# updated report costs one pass over the new rows plus one over the tables,
+# and matches a rebuild of the whole cumulative upload exactly.
+
+SAMPLE_ROWS = 50
+
+# how each value column combines when tables are merged
+REDUCERS = {"rows": "sum", "att": "sum", "truthy": "sum", "risk_max": "max", "first": "min"}
+
+
+class Table:
+    """Aggregate rows keyed by vocabulary codes (-1 = missing), one row per key."""
+
+    __slots__ = ("dims", "codes", "values")
+
+    def __init__(self, dims: tuple, codes: list, values: dict):
+        self.dims = tuple(dims)
+        self.codes = list(codes)
+        self.values = values
+
+    def __len__(self) -> int:
+        return len(self.codes[0]) if self.codes else 0
+
+    @classmethod
+    def of(cls, dims: tuple, codes: list, sizes: list, values: dict) -> "Table":
+        """Group rows by their codes (missing included) and reduce every value column."""
+        g = Groups(codes, sizes, missing=True)
+        out = {}
+        for name, v in values.items():
+            how = REDUCERS[name]
+            out[name] = g.sum(v) if how == "sum" else g.max(v) if how == "max" else g.min(v)
+        return cls(dims, g.keys, out)
+
+
+class ReportState:
+    """Aggregate tables of one upload (or several merged ones) plus what they
+    cannot hold: totals, cleaning stats and the first sample rows."""
+
+    def __init__(self, version: str, roles: dict, columns: list, vocab: dict,
+                 tables: dict, totals: dict, cleaning_stats: dict, sample_rows: list):
+        self.version = version
+        self.roles = roles        # report role -> column name (ingest.resolve_columns)
+        self.columns = columns    # cleaned frame columns, for sample rows
+        self.vocab = vocab        # dim -> sorted distinct values
+        self.tables = tables      # name -> Table
+        self.totals = totals      # additive counters: rows, total_records, ...
+        self.cleaning_stats = cleaning_stats
+        self.sample_rows = sample_rows
+
+    def column(self, table: str, dim: str) -> Encoded:
+        t = self.tables[table]
+        return Encoded(t.codes[t.dims.index(dim)], self.vocab[dim])
+
+    def counts(self, table: str, dropna: bool = True) -> pd.Series:
+        """value_counts of a one-dim table: count desc, ties by first appearance."""
+        t = self.tables[table]
+        codes = t.codes[0]
+        keep = codes >= 0 if dropna else np.ones(len(codes), dtype=bool)
+        return ordered_counts(self.vocab[t.dims[0]], codes[keep], t.values["rows"][keep], t.values["first"][keep])
+
+
+def _union(a: list, b: list):
+    """Sorted union of two vocabularies and the code maps into it."""
+    codes, uniques = pd.factorize(np.asarray(list(a) + list(b), dtype=object), sort=True)
+    return list(uniques), codes[:len(a)], codes[len(a):]
+
+
+def _remap(codes: np.ndarray, mapping: np.ndarray) -> np.ndarray:
+    if not len(mapping):
+        return codes
+    return np.where(codes >= 0, mapping[np.maximum(codes, 0)], -1)
+
+
+def merge(old: ReportState, new: ReportState) -> ReportState:
+    """State of old's rows followed by new's rows."""
+    if old.version != new.version:
+        raise ValueError("The previous report was built by an older version; upload the full workbook instead.")
+    if old.roles != new.roles or old.columns != new.columns:
+        raise ValueError("The new rows do not have the same columns as the previous upload.")
+
+    vocab, maps = {}, {}
+    for dim in old.vocab:
+        vocab[dim], a, b = _union(old.vocab[dim], new.vocab[dim])
+        maps[dim] = (a, b)
+
+    offset = old.totals["rows"]  # new rows come after the old ones
+    tables = {}
+    for name, t_old in old.tables.items():
+        t_new = new.tables[name]
+        codes = [np.concatenate([_remap(t_old.codes[i], maps[d][0]), _remap(t_new.codes[i], maps[d][1])])
+                 for i, d in enumerate(t_old.dims)]
+        values = {}
+        for k, v in t_old.values.items():
+            v_new = t_new.values[k] + offset if k == "first" else t_new.values[k]
+            values[k] = np.concatenate([v, v_new])
+        tables[name] = Table.of(t_old.dims, codes, [len(vocab[d]) for d in t_old.dims], values)
+
+    totals = {k: old.totals[k] + new.totals[k] for k in old.totals}
+    cleaning_stats = {k: old.cleaning_stats[k] + new.cleaning_stats[k] for k in old.cleaning_stats}
+    sample_rows = (old.sample_rows + new.sample_rows)[:SAMPLE_ROWS]
+    return ReportState(old.version, old.roles, old.columns, vocab, tables, totals, cleaning_stats, sample_rows)
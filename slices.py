@@ -0,0 +1,103 @@
+from cube import BASES as CUBE_BASES
+
+# ---------------- report slices ----------------
+# The page only embeds the parts of a report whose size does not depend on
+# the cohort (charts, filters, top-K lists). Everything keyed by student is
+# kept server-side and served per student / module / week by the JSON API.
+
+# report keys that stay on the server
+SERVER_ONLY_KEYS = (
+    "ranking",
+    "student_lookup",
+    "ps_modules_att",
+    "ps_weeks_att",
+    "ps_risk_module_max",
+    "ps_week_risk_counts",
+    "ps_week_module_att",
+    "student_module_summary",
+    "module_week_capacity",
+    "filter_cube",
+)
+
+# student slice field -> report key
+STUDENT_FIELDS = {
+    "modules_att": "ps_modules_att",
+    "weeks_att": "ps_weeks_att",
+    "risk_module_max": "ps_risk_module_max",
+    "week_risk_counts": "ps_week_risk_counts",
+    "week_module_att": "ps_week_module_att",
+    "module_summary": "student_module_summary",
+}
+
+
+def summary(report: dict) -> dict:
+    out = {k: v for k, v in report.items() if k not in SERVER_ONLY_KEYS}
+    out["student_count"] = len(report.get("student_lookup") or [])
+    return out
+
+
+def search_students(report: dict, q: str = "", limit: int = 20) -> dict:
+    """Students whose label contains q (case-insensitive), in lookup order."""
+    q = (q or "").strip().lower()
+    items = []
+    for s in report.get("student_lookup") or []:
+        if q and q not in s["label"].lower():
+            continue
+        if len(items) == limit:
+            return {"items": items, "more": True}
+        items.append(s)
+    return {"items": items, "more": False}
+
+
+def student_slice(report: dict, sid: str):
+    student = next((s for s in report.get("student_lookup") or [] if s["id"] == sid), None)
+    if student is None:
+        return None
+    out = {"student": student}
+    for field, key in STUDENT_FIELDS.items():
+        out[field] = (report.get(key) or {}).get(sid, [] if field == "module_summary" else {})
+    return out
+
+
+def module_slice(report: dict, module: str):
+    if module not in (report.get("modules") or []):
+        return None
+    by_week_all = report.get("by_week_module_all") or {}
+    by_week_att = report.get("by_week_module_attendance") or {}
+    return {
+        "module": module,
+        "students": (report.get("by_module") or {}).get(module, 0),
+        "students_att": (report.get("by_module_attendance") or {}).get(module, 0),
+        "absences": (report.get("by_module_abs_total") or {}).get(module, 0),
+        "weeks_all": {w: mods[module] for w, mods in by_week_all.items() if module in mods},
+        "weeks_att": {w: mods[module] for w, mods in by_week_att.items() if module in mods},
+        "capacity": (report.get("module_week_capacity") or {}).get(module, {}),
+        "top": (report.get("module_top_students_att") or {}).get(module, []),
+    }
+
+
+def week_slice(report: dict, week: str):
+    if week not in (report.get("weeks") or []):
+        return None
+    week_risk = report.get("week_risk") or {}
+    weeks = week_risk.get("weeks") or []
+    risk = {}
+    if week in weeks:
+        i = weeks.index(week)
+        risk = {s["name"]: s["data"][i] for s in week_risk.get("series") or []}
+    return {
+        "week": week,
+        "attendance": (report.get("by_week_attendance") or {}).get(week, 0),
+        "resolved_rate": (report.get("resolved_rate") or {}).get(week),
+        "modules_all": (report.get("by_week_module_all") or {}).get(week, {}),
+        "modules_att": (report.get("by_week_module_attendance") or {}).get(week, {}),
+        "risk": risk,
+    }
+
+
+def module_counts(report: dict, filters: dict, basis: str = "all", top: int = 0):
+    """Module chart data for a week / qualification / risk filter, from the cube."""
+    cube = report.get("filter_cube")
+    if cube is None:
+        return None
+    return cube.slice(filters, basis if basis in CUBE_BASES else "all", top)
@@ -0,0 +1,134 @@
+(function () {
+  // Client for the report JSON API. The page only embeds a summary of the
+  // report; per-student, per-module and per-week data is fetched on demand.
+  const reportId = window.__REPORT_ID__ || "";
+  const base = reportId ? `/api/reports/${encodeURIComponent(reportId)}` : "";
+
+  // a few recently viewed students, so both dashboard scripts share one request
+  const MAX_CACHED = 50;
+  const studentCache = new Map();
+  // filter cube answers are tiny and never change for a report
+  const moduleCountsCache = new Map();
+  // label -> id for everything a search has returned
+  const labelToId = {};
+
+  async function getJSON(path, params) {
+    if (!base) throw new Error("No report loaded.");
+    const qs = params ? "?" + new URLSearchParams(params) : "";
+    const res = await fetch(base + path + qs, { headers: { Accept: "application/json" } });
+    const body = await res.json().catch(() => ({}));
+    if (!res.ok) throw new Error(body.error || `Request failed (${res.status})`);
+    return body;
+  }
+
+  function remember(students) {
+    (students || []).forEach(s => { if (s && s.label) labelToId[s.label] = s.id; });
+    return students;
+  }
+
+  // ---- columnar per-student bundle (see wire.py) ----
+  // For cohorts up to this size every student's data comes in one compressed
+  // download; slices are decoded from it on demand. Larger cohorts, or a
+  // failed download, fall back to one request per student.
+  const BUNDLE_MAX_STUDENTS = 20000;
+  const summary = window.__REPORT__ || {};
+  let bundle = null;
+
+  function loadBundle() {
+    if (!bundle) {
+      bundle = (summary.student_count || 0) > BUNDLE_MAX_STUDENTS
+        ? Promise.resolve(null)
+        : getJSON("/student-data").then(indexBundle).catch(() => null);
+    }
+    return bundle;
+  }
+  function indexBundle(w) {
+    if (!w || w.format !== "soit-columnar/1") return null;
+    w.row = new Map(w.students.id.map((id, i) => [String(id), i]));
+    w.students.id.forEach((id, i) => { labelToId[bundleStudent(w, i).label] = String(id); });
+    return w;
+  }
+  function bundleStudent(w, i) {
+    // same label format as student_lookup
+    const id = w.students.id[i], name = w.students.name[i];
+    const qual = w.tables.quals[w.students.qual[i]] || "";
+    let label = name ? `${id} — ${name}` : String(id);
+    if (qual) label += ` — [${qual}]`;
+    return { id, label, name, qual };
+  }
+  function decodeRow(csr, i, put) {
+    const out = {};
+    for (let j = csr.indptr[i]; j < csr.indptr[i + 1]; j++) put(out, csr.col[j], csr.val[j]);
+    return out;
+  }
+  async function fromBundle(sid) {
+    const w = await loadBundle();
+    if (!w) return null;
+    const i = w.row.get(sid);
+    if (i === undefined) return null;
+    const { modules, weeks, risks } = w.tables;
+    const W = weeks.length, R = risks.length, f = w.fields;
+    const summaryRows = [];
+    for (let j = f.module_summary.indptr[i]; j < f.module_summary.indptr[i + 1]; j++) {
+      summaryRows.push({
+        module: modules[f.module_summary.col[j]],
+        total_absences: f.module_summary.val[j],
+        rate: f.module_summary.rate[j],
+      });
+    }
+    return {
+      student: bundleStudent(w, i),
+      modules_att: decodeRow(f.modules_att, i, (o, c, v) => { o[modules[c]] = v; }),
+      weeks_att: decodeRow(f.weeks_att, i, (o, c, v) => { o[weeks[c]] = v; }),
+      risk_module_max: decodeRow(f.risk_module_max, i, (o, c, v) => { o[modules[c]] = risks[v]; }),
+      week_risk_counts: decodeRow(f.week_risk_counts, i, (o, c, v) => {
+        const wk = weeks[Math.floor(c / R)];
+        (o[wk] = o[wk] || {})[risks[c % R]] = v;
+      }),
+      week_module_att: decodeRow(f.week_module_att, i, (o, c, v) => {
+        const m = modules[Math.floor(c / W)];
+        (o[m] = o[m] || {})[weeks[c % W]] = v;
+      }),
+      module_summary: summaryRows,
+    };
+  }
+
+  window.SoitApi = {
+    reportId,
+    idForLabel: (label) => labelToId[label] || "",
+    student(sid) {
+      sid = String(sid);
+      if (studentCache.has(sid)) {
+        const hit = studentCache.get(sid);
+        studentCache.delete(sid); studentCache.set(sid, hit); // most recent last
+        return hit;
+      }
+      const p = fromBundle(sid)
+        .then(d => d || getJSON(`/students/${encodeURIComponent(sid)}`))
+        .then(d => { remember([d.student]); return d; });
+      p.catch(() => studentCache.delete(sid));
+      studentCache.set(sid, p);
+      if (studentCache.size > MAX_CACHED) studentCache.delete(studentCache.keys().next().value);
+      return p;
+    },
+    searchStudents: (q, limit = 20) =>
+      getJSON("/students", { q, limit }).then(d => { remember(d.items); return d; }),
+    topStudents: (params) => getJSON("/top-students", params).then(d => { remember(d.items); return d; }),
+    // streamed CSV / XLSX download of a table (see export.py), as a link target
+    exportUrl(table, format, params) {
+      const qs = new URLSearchParams(Object.entries(params || {}).filter(([, v]) => v)).toString();
+      return `${base}/export/${table}.${format}` + (qs ? "?" + qs : "");
+    },
+    module: (m) => getJSON(`/modules/${encodeURIComponent(m)}`),
+    week: (w) => getJSON(`/weeks/${encodeURIComponent(w)}`),
+    moduleCounts(params) {
+      const key = new URLSearchParams(params).toString();
+      if (!moduleCountsCache.has(key)) {
+        const p = getJSON("/module-counts", params);
+        p.catch(() => moduleCountsCache.delete(key));
+        moduleCountsCache.set(key, p);
+      }
+      return moduleCountsCache.get(key);
+    },
+  };
+})();
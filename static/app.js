@@ -147,45 +147,43 @@
   const scopeSel = document.getElementById("moduleScope");
   const basisSel = document.getElementById("moduleBasis");
   const qualSel  = document.getElementById("qualFilter");
+  const riskSel  = document.getElementById("riskFilter");
   const applyBtn = document.getElementById("applyFilters");
   const resetBtn = document.getElementById("resetFilters");
 
-  function getModuleCounts({ week = "", basis = "all", scope = "all", qual = "" }) {
-    let dataMap = {};
-
+  // Unfiltered counts are embedded in the page; qualification and risk
+  // filters are answered by the server-side filter cube (/module-counts).
+  let moduleReq = 0;
+  async function getModuleCounts({ week = "", basis = "all", scope = "all", qual = "", risk = "" }) {
     const isTop = scope.startsWith("top");
     const topN = scope === "top3_att" ? 3 : scope === "top5_att" ? 5 : scope === "top10_att" ? 10 : null;
 
-    // choose the right bucket
-    if (basis === "attendance") {
-      if (qual) {
-        dataMap = week
-          ? (report.by_week_module_att_by_qual?.[qual]?.[week] || {})
-          : (report.by_module_att_by_qual?.[qual] || {});
-      } else {
-        dataMap = week
-          ? (report.by_week_module_attendance?.[week] || {})
-          : (report.by_module_attendance || {});
+    let pairs = [];
+    if (qual || risk) {
+      if (window.SoitApi?.reportId) {
+        const d = await window.SoitApi.moduleCounts({ week, qual, risk, basis });
+        pairs = d.modules.map((m, i) => [m, d.students[i]]);
       }
     } else {
-      if (qual) {
+      // choose the right bucket
+      let dataMap;
+      if (basis === "attendance") {
         dataMap = week
-          ? (report.by_week_module_all_by_qual?.[qual]?.[week] || {})
-          : (report.by_module_all_by_qual?.[qual] || {});
+          ? (report.by_week_module_attendance?.[week] || {})
+          : (report.by_module_attendance || {});
       } else {
         dataMap = week
           ? (report.by_week_module_all?.[week] || {})
           : (report.by_module || {});
       }
+      pairs = Object.entries(dataMap).map(([k, v]) => [String(k), Number(v)]);
     }
-
-    let pairs = Object.entries(dataMap).map(([k, v]) => [String(k), Number(v)]);
     pairs.sort((a, b) => b[1] - a[1]);
     if (isTop && topN) pairs = pairs.slice(0, topN);
     return { labels: pairs.map(p => p[0]), values: pairs.map(p => p[1]) };
   }
 
-  function renderModuleChart() {
+  async function renderModuleChart() {
     const wrap = document.getElementById("moduleChartWrap");
     const ctx  = document.getElementById("moduleChart");
     if (!wrap || !ctx) return;
@@ -193,11 +191,23 @@
     const scope = scopeSel?.value || "all";
     const basis = basisSel?.value || "all";
     const qual  = qualSel?.value || "";
-
-    const { labels, values } = getModuleCounts({ week, basis, scope, qual });
-    if (!labels.length) { hideCardByCanvas("moduleChart"); return; }
-    setDynamicHeight(wrap, labels.length);
+    const risk  = riskSel?.value || "";
+
+    const req = ++moduleReq;
+    let counts;
+    try {
+      counts = await getModuleCounts({ week, basis, scope, qual, risk });
+    } catch (err) {
+      counts = { labels: [], values: [] };
+    }
+    if (req !== moduleReq) return; // a newer filter change won
+    const { labels, values } = counts;
+    const card = ctx.closest(".card");
     moduleChart?.destroy();
+    moduleChart = null;
+    if (!labels.length) { card?.classList.add("hidden"); return; }
+    card?.classList.remove("hidden");
+    setDynamicHeight(wrap, labels.length);
     moduleChart = makeBar(ctx, labels, values, true);
   }
   renderModuleChart();
@@ -209,73 +219,57 @@
     if (scopeSel) scopeSel.value = "all";
     if (basisSel) basisSel.value = "all";
     if (qualSel)  qualSel.value  = "";
+    if (riskSel)  riskSel.value  = "";
     renderModuleChart();
   });
 
   // ----- Student analysis (shows qualification + optional filter) -----
-  if (report.student_enabled) {
+  // Per-student data is not embedded in the page; it is fetched via SoitApi.
+  if (report.student_enabled && window.SoitApi) {
+    const api = window.SoitApi;
     const studentSearch = document.getElementById("studentSearch");
-    const topModuleSelect = document.getElementById("topModuleSelect");
-    const topQualSelect   = document.getElementById("topQualSelect");
-    const topNStudent = document.getElementById("topNStudent");
-    const renderTopListBtn = document.getElementById("renderTopList");
+    const studentsList = document.getElementById("studentsList");
     const analyzeStudentBtn = document.getElementById("analyzeStudentBtn");
-    const topStudentList = document.getElementById("topStudentList");
     const studentSelectedNote = document.getElementById("studentSelectedNote");
 
-    // Maps
-    const labelToId = {};
-    const idToLabel = {};
-    const idToQual  = {};
-    (report.student_lookup || []).forEach(s => {
-      labelToId[s.label] = s.id; idToLabel[s.id] = s.label; idToQual[s.id] = s.qual || "";
+    // search-as-you-type suggestions (the full student list never reaches the page)
+    let searchTimer = null;
+    studentSearch?.addEventListener("input", () => {
+      clearTimeout(searchTimer);
+      const q = studentSearch.value.trim();
+      if (api.idForLabel(q)) return; // picked from the list
+      searchTimer = setTimeout(async () => {
+        try {
+          const { items } = await api.searchStudents(q, 20);
+          // labels hold names from the sheet: set them as values, never as markup
+          if (studentsList) studentsList.replaceChildren(...items.map(s => {
+            const opt = document.createElement("option");
+            opt.value = s.label;
+            return opt;
+          }));
+        } catch (err) { /* keep the previous suggestions */ }
+      }, 200);
     });
 
     // charts
     let stuModAttChart, stuWeekAttChart, stuWeekRiskChart;
 
-    function renderTopList() {
-      const mod = topModuleSelect?.value || "";
-      const qual= topQualSelect?.value || "";
-      const n = parseInt(topNStudent?.value || "10", 10) || 10;
-
-      let list = [];
-      if (mod && qual && report.module_top_students_att_by_qual?.[qual]?.[mod]) {
-        list = report.module_top_students_att_by_qual[qual][mod].slice(0, n);
-      } else if (mod && report.module_top_students_att?.[mod]) {
-        list = report.module_top_students_att[mod].slice(0, n);
-      } else if (qual && report.global_top_students_att_by_qual?.[qual]) {
-        list = report.global_top_students_att_by_qual[qual].slice(0, n);
-      } else if (report.global_top_students_att) {
-        list = report.global_top_students_att.slice(0, n);
-      }
-
-      if (!list.length) { topStudentList.innerHTML = "<em>No data for the selection.</em>"; return; }
-
-      topStudentList.innerHTML = list.map(x =>
-        `<button class="btn btn-outline" data-sid="${x.id}" data-label="${x.label}" style="margin:4px 6px 0 0;">${x.label} (${x.count})</button>`
-      ).join("");
-
-      topStudentList.querySelectorAll("button[data-sid]").forEach(b => {
-        b.addEventListener("click", () => {
-          if (studentSearch) studentSearch.value = b.dataset.label;
-          analyzeStudent(b.dataset.sid);
-        });
-      });
-    }
-
-    function analyzeStudent(sid) {
+    async function analyzeStudent(sid) {
       if (!sid) {
         const typed = studentSearch?.value || "";
-        sid = labelToId[typed] || normalizeId(typed);
+        sid = api.idForLabel(typed) || normalizeId(typed);
       }
       if (!sid) { studentSelectedNote.textContent = "Pick a student."; return; }
 
-      const qual = idToQual[sid] || "";
-      studentSelectedNote.textContent = `Selected: ${idToLabel[sid] || sid}${qual ? " · Qualification: " + qual : ""}`;
+      let data;
+      try { data = await api.student(sid); }
+      catch (err) { studentSelectedNote.textContent = err.message; return; }
+
+      const qual = data.student.qual || "";
+      studentSelectedNote.textContent = `Selected: ${data.student.label || sid}${qual ? " · Qualification: " + qual : ""}`;
 
       // Non-attendance by module
-      const modMap = report.ps_modules_att?.[sid] || {};
+      const modMap = data.modules_att || {};
       const mods = Object.keys(modMap), modVals = mods.map(m => modMap[m]);
       const modWrap = document.getElementById("stuModAttWrap");
       setDynamicHeight(modWrap, mods.length);
@@ -284,7 +278,7 @@
       else { hideEl("stuModAttCard"); }
 
       // Non-attendance by week
-      const wkMap = report.ps_weeks_att?.[sid] || {};
+      const wkMap = data.weeks_att || {};
       const weeks = sortedWeeks(Object.keys(wkMap));
       const wkVals = weeks.map(w => wkMap[w]);
       stuWeekAttChart?.destroy();
@@ -292,7 +286,7 @@
       else { hideEl("stuWeekAttCard"); }
 
       // Risk by week (multi-series)
-      const wkRisk = report.ps_week_risk_counts?.[sid] || {};
+      const wkRisk = data.week_risk_counts || {};
       const wks = sortedWeeks(Object.keys(wkRisk));
       const riskNames = Array.from(new Set([].concat(...wks.map(w => Object.keys(wkRisk[w])))));
       const series = riskNames.map(name => ({ name, data: wks.map(w => (wkRisk[w][name] || 0)) }));
@@ -301,7 +295,7 @@
       else { hideEl("stuWeekRiskCard"); }
 
       // Risk by module table
-      const riskMod = report.ps_risk_module_max?.[sid] || {};
+      const riskMod = data.risk_module_max || {};
       const tblWrap = document.getElementById("stuRiskModuleTable");
       if (Object.keys(riskMod).length) {
         const rows = Object.entries(riskMod).sort((a,b)=>a[0].localeCompare(b[0]));
@@ -314,9 +308,7 @@
       }
     }
 
-    // init
-    renderTopList();
-    renderTopListBtn?.addEventListener("click", (e) => { e.preventDefault(); renderTopList(); });
+    // init (the top-student list is rendered and paged by heatmap-addon.js)
     analyzeStudentBtn?.addEventListener("click", (e) => { e.preventDefault(); analyzeStudent(); });
   }
 })();
@@ -1,6 +1,7 @@
 (function () {
   const report = window.__REPORT__ || {};
-  if (!report || !report.student_enabled) return;
+  const api = window.SoitApi;
+  if (!report || !report.student_enabled || !api) return;
 
   // ------- DOM -------
   const studentSearch = document.getElementById("studentSearch");
@@ -28,6 +29,8 @@
   const rateBand = document.getElementById("rateBand");
   const renderTopListBtn = document.getElementById("renderTopList");
   const topStudentList = document.getElementById("topStudentList");
+  const topExportCsv = document.getElementById("topExportCsv");
+  const topExportXlsx = document.getElementById("topExportXlsx");
 
   // ------- helpers -------
   const ALL_WEEKS = sortedWeeks(report.weeks || []);
@@ -47,18 +50,14 @@
     items.sort((a, b) => a.n - b.n || a.w.localeCompare(b.w));
     return items.map(x => x.w);
   }
-  const labelToId = {};
-  (report.student_lookup || []).forEach(s => {
-    if (s && s.label) labelToId[s.label] = s.id || normalizeId(s.label);
-  });
   function sidFromInput() {
     const typed = studentSearch?.value || "";
-    return labelToId[typed] || normalizeId(typed);
+    return api.idForLabel(typed) || normalizeId(typed);
   }
 
   // ---- options fill ----
-  function fillModuleSelectForStudent(selectEl, sid, multi = false) {
-    const modMap = (report.ps_week_module_att && report.ps_week_module_att[sid]) || {};
+  // modMap: module -> week -> absences, from the student's API slice
+  function fillModuleSelectForStudent(selectEl, modMap, multi = false) {
     const mods = Object.keys(modMap).sort((a, b) => a.localeCompare(b));
     if (!mods.length) {
       selectEl.innerHTML = `<option value="">No module data for this student</option>`;
@@ -82,9 +81,9 @@
   }
 
   // ---- heatmap render (multi-row) ----
-  function renderStudentHeatmapRows(sid, modules, wStart, wEnd) {
+  function renderStudentHeatmapRows(modMapAll, modules, wStart, wEnd) {
     if (!stuHeatmapWrap) return;
-    const modMapAll = (report.ps_week_module_att && report.ps_week_module_att[sid]) || {};
+    modMapAll = modMapAll || {};
 
     if (!modules || !modules.length) {
       stuHeatmapWrap.innerHTML = `<p class="muted tiny">Pick at least one module.</p>`;
@@ -131,24 +130,9 @@
   }
 
   // ---- student module summary ----
-  function computeSummaryLocally(sid) {
-    const rows = [];
-    const modMap = (report.ps_week_module_att && report.ps_week_module_att[sid]) || {};
-    const capacity = report.module_week_capacity || {};
-    (Object.keys(modMap)).forEach(mod => {
-      const wkMap = modMap[mod] || {};
-      const total = Object.values(wkMap).reduce((a, b) => a + Number(b || 0), 0);
-      const caps = capacity[mod] || {};
-      const denom = (report.weeks || []).reduce((s, w) => s + Number(caps[String(w)] || 0), 0);
-      const rate = denom ? Math.round((total / denom) * 1000) / 10 : 0;
-      rows.push({ module: mod, total_absences: total, rate });
-    });
-    return rows;
-  }
-  function renderStudentModuleSummary(sid) {
+  function renderStudentModuleSummary(rows) {
     if (!stuModSummaryWrap) return;
-    let rows = (report.student_module_summary && report.student_module_summary[sid]) || [];
-    if (!rows || !rows.length) rows = computeSummaryLocally(sid);
+    rows = rows || [];
     if (!rows.length) {
       stuModSummaryWrap.innerHTML = `<p class="muted tiny">No module summary available for this student.</p>`;
       return;
@@ -166,7 +150,9 @@
     stuModSummaryWrap.innerHTML = html;
   }
 
-  // ---- top-list rendering (unchanged logic, shows Absences only on the chip) ----
+  // ---- top-list rendering: first page on render, more on demand (shows Absences only on the chip) ----
+  let topPage = { params: null, offset: 0, total: 0 };
+
   function inBand(rate, band) {
     if (!band) return true;
     const r = Number(rate || 0);
@@ -175,80 +161,113 @@
     if (band === "high") return r >= 70;
     return true;
   }
-  function topStudentsData() {
-    const base = (report.global_top_students_att || []).slice();
-    const mod = topModuleSelect?.value || "";
-    if (mod) {
-      const arr = ((report.module_top_students_att || {})[mod] || []).map(x => ({
-        id: x.id, label: x.label, count: x.count, rate: x.rate, qual: x.qual
-      }));
-      return arr;
-    }
-    return base;
+  // fallback when the server no longer has the report: filter the embedded top-K
+  function localTopPage({ module, qual, basis, band }, offset, limit) {
+    let arr = module
+      ? ((report.module_top_students_att || {})[module] || []).slice()
+      : (report.global_top_students_att || []).slice();
+    if (qual) arr = arr.filter(x => x.qual === qual);
+    arr = arr.filter(x => inBand(x.rate, band));
+    if (basis === "rate") arr.sort((a, b) => Number(b.rate) - Number(a.rate));
+    return { total: arr.length, items: arr.slice(offset, offset + limit) };
   }
-  function renderTopList() {
-    if (!topStudentList) return;
-    const n = parseInt(topNStudent?.value || "10", 10);
-    const basis = topBasis?.value || "count";
-    const band = rateBand?.value || "";
-    const qual = (topQualSelect?.value || "").trim();
-
-    let arr = topStudentsData();
-    if (qual) {
-      const rx = new RegExp(`\\[${qual.replace(/[.*+?^${}()|[\\]\\\\]/g, "\\$&")}\\]`);
-      arr = arr.filter(x => (x.qual && x.qual === qual) || rx.test(x.label || ""));
+  async function fetchTopPage(params, offset, limit) {
+    try {
+      return await api.topStudents({ ...params, offset, limit });
+    } catch (err) {
+      return localTopPage(params, offset, limit);
     }
-    arr = arr.filter(x => inBand(x.rate, band));
-    arr.sort((a, b) => {
-      const av = basis === "rate" ? Number(a.rate) : Number(a.count);
-      const bv = basis === "rate" ? Number(b.rate) : Number(b.count);
-      return bv - av;
+  }
+  function chipHtml(x) {
+    const count = Number(x.count ?? 0);
+    return `
+      <button class="btn btn-outline" data-sid="${x.id}" data-label="${x.label}" style="margin:4px 6px 0 0;">
+        ${x.label}
+        <span class="pill" style="margin-left:6px;">Absences: ${count}</span>
+      </button>`;
+  }
+  function bindChips(root) {
+    root.querySelectorAll("button[data-sid]:not([data-bound])").forEach(b => {
+      b.dataset.bound = "1";
+      b.addEventListener("click", () => {
+        if (studentSearch) studentSearch.value = b.dataset.label;
+        // runs every "analyze" handler (charts in app.js, summary + heatmap here)
+        if (analyzeStudentBtn) analyzeStudentBtn.click(); else analyzeStudent(b.dataset.sid, true);
+      });
     });
-    arr = arr.slice(0, n);
-
-    if (!arr.length) {
+  }
+  async function appendTopPage(limit) {
+    const { params, offset } = topPage;
+    const data = await fetchTopPage(params, offset, limit);
+    if (params !== topPage.params) return; // filters changed while loading
+    topPage.offset = offset + (data.items || []).length;
+    topPage.total = data.total || 0;
+
+    topStudentList.querySelector("[data-more]")?.remove();
+    if (!offset && !topPage.offset) {
       topStudentList.innerHTML = "<em>No data for the selection.</em>";
       return;
     }
-
-    topStudentList.innerHTML = arr.map(x => {
-      const count = Number(x.count ?? 0);
-      return `
-        <button class="btn btn-outline" data-sid="${x.id}" data-label="${x.label}" style="margin:4px 6px 0 0;">
-          ${x.label}
-          <span class="pill" style="margin-left:6px;">Absences: ${count}</span>
-        </button>`;
-    }).join("");
-
-    topStudentList.querySelectorAll("button[data-sid]").forEach(b => {
-      b.addEventListener("click", () => {
-        if (studentSearch) studentSearch.value = b.dataset.label;
-        analyzeStudent(b.dataset.sid, true);
+    topStudentList.insertAdjacentHTML("beforeend", (data.items || []).map(chipHtml).join(""));
+    bindChips(topStudentList);
+    if (topPage.offset < topPage.total) {
+      topStudentList.insertAdjacentHTML("beforeend",
+        `<button class="btn" data-more style="margin:4px 6px 0 0;">Show more (${topPage.total - topPage.offset} left)</button>`);
+      topStudentList.querySelector("[data-more]").addEventListener("click", (e) => {
+        e.preventDefault();
+        appendTopPage(limit);
       });
-    });
+    }
+  }
+  function renderTopList() {
+    if (!topStudentList) return;
+    const n = parseInt(topNStudent?.value || "10", 10);
+    topPage = {
+      params: {
+        module: topModuleSelect?.value || "",
+        qual: (topQualSelect?.value || "").trim(),
+        basis: topBasis?.value || "count",
+        band: rateBand?.value || "",
+      },
+      offset: 0, total: 0,
+    };
+    // the whole filtered list, not just the chips shown
+    if (topExportCsv) topExportCsv.href = api.exportUrl("top-students", "csv", topPage.params);
+    if (topExportXlsx) topExportXlsx.href = api.exportUrl("top-students", "xlsx", topPage.params);
+    topStudentList.innerHTML = "";
+    appendTopPage(n);
   }
 
   // ---- analyze student ----
-  function analyzeStudent(sid, autoRender = true) {
+  async function studentData(sid) {
+    try {
+      return await api.student(sid);
+    } catch (err) {
+      studentSelectedNote.textContent = err.message;
+      return null;
+    }
+  }
+  async function analyzeStudent(sid, autoRender = true) {
     if (!sid) sid = sidFromInput();
     if (!sid) {
       studentSelectedNote.textContent = "Pick a student.";
       return;
     }
-    const picked = (report.student_lookup || []).find(x => x.id === sid);
-    studentSelectedNote.textContent = picked ? `Selected: ${picked.label}` : `Selected: ${sid}`;
+    const data = await studentData(sid);
+    if (!data) return;
+    studentSelectedNote.textContent = `Selected: ${data.student.label || sid}`;
 
-    renderStudentModuleSummary(sid);
+    renderStudentModuleSummary(data.module_summary);
 
-    const firstModTop = fillModuleSelectForStudent(stuModuleForHeatmap, sid, false);
-    fillModuleSelectForStudent(hmModule, sid, true);
+    const firstModTop = fillModuleSelectForStudent(stuModuleForHeatmap, data.week_module_att, false);
+    fillModuleSelectForStudent(hmModule, data.week_module_att, true);
     fillWeeks(hmFrom);
     fillWeeks(hmTo);
 
     if (autoRender) {
       // default: if user hasn’t chosen, render first module only
       if (firstModTop) {
-        renderStudentHeatmapRows(sid, [firstModTop]);
+        renderStudentHeatmapRows(data.week_module_att, [firstModTop]);
       }
     }
   }
@@ -261,28 +280,30 @@
   analyzeStudentBtn?.addEventListener("click", (e) => { e.preventDefault(); analyzeStudent(); });
 
   // legacy single render
-  renderStudentHeatmapBtn?.addEventListener("click", (e) => {
+  renderStudentHeatmapBtn?.addEventListener("click", async (e) => {
     e.preventDefault();
     const sid = sidFromInput();
     if (!sid) { studentSelectedNote.textContent = "Pick a student first."; return; }
     const mod = stuModuleForHeatmap.value || "";
     if (!mod) { stuHeatmapWrap.innerHTML = `<p class="muted tiny">Pick a module.</p>`; return; }
-    renderStudentHeatmapRows(sid, [mod]);
+    const data = await studentData(sid);
+    if (data) renderStudentHeatmapRows(data.week_module_att, [mod]);
   });
 
   // inline multi render
-  hmRender?.addEventListener("click", (e) => {
+  hmRender?.addEventListener("click", async (e) => {
     e.preventDefault();
     const sid = sidFromInput();
     if (!sid) { studentSelectedNote.textContent = "Pick a student first."; return; }
+    const data = await studentData(sid);
+    if (!data) return;
 
     const sel = Array.from(hmModule?.selectedOptions || []).map(o => o.value);
     let modules = sel;
 
     // "(All modules)"
     if (modules.includes("__ALL__")) {
-      const modMap = (report.ps_week_module_att && report.ps_week_module_att[sid]) || {};
-      modules = Object.keys(modMap).sort((a,b)=>a.localeCompare(b));
+      modules = Object.keys(data.week_module_att || {}).sort((a,b)=>a.localeCompare(b));
     }
 
     if (!modules.length) {
@@ -295,6 +316,6 @@
 
     const from = hmFrom.value || "";
     const to = hmTo.value || "";
-    renderStudentHeatmapRows(sid, modules, from, to);
+    renderStudentHeatmapRows(data.week_module_att, modules, from, to);
   });
 })();
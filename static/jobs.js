@@ -0,0 +1,107 @@
+(function () {
+  // Upload in job mode: the file goes to /jobs, which answers with a job id
+  // straight away; we poll its progress and open the report when it is ready.
+  // Anything unexpected falls back to the plain form post.
+  const form = document.querySelector("form.upload");
+  const box = document.getElementById("jobProgress");
+  if (!form || !box || !window.fetch || !window.FormData) return;
+
+  const bar = box.querySelector("progress");
+  const text = box.querySelector("[data-job-text]");
+  const cancelBtn = box.querySelector("[data-job-cancel]");
+  const submitBtn = form.querySelector("button[type=submit]");
+
+  const POLL_MS = 1000;
+  const STAGE_TEXT = {
+    read: "Reading file",
+    clean: "Cleaning records",
+    normalize: "Normalizing columns",
+    store: "Saving records",
+    aggregate: "Building breakdowns",
+    students: "Building student analytics",
+    ranking: "Ranking students",
+    cache: "Saving report",
+  };
+  let current = null;
+  let fallback = false;
+
+  function show(msg, step, steps) {
+    box.classList.remove("hidden");
+    text.textContent = msg;
+    bar.max = steps || 1;
+    bar.value = step || 0;
+  }
+  function stop(msg) {
+    current = null;
+    submitBtn.disabled = false;
+    cancelBtn.classList.add("hidden");
+    if (msg) show(msg, 0, 1); else box.classList.add("hidden");
+  }
+  function plainSubmit() {
+    fallback = true;
+    form.submit();
+  }
+
+  function render(job) {
+    if (job.status === "done") {
+      show("Report ready, opening…", job.steps, job.steps);
+      window.location.href = `/reports/${job.result.report_id}`;
+      return true;
+    }
+    if (job.status === "failed") { stop(`Failed to read file: ${job.error || "unknown error"}`); return true; }
+    if (job.status === "cancelled") { stop("Upload cancelled."); return true; }
+    if (job.status === "queued") {
+      show(job.position ? `Queued (position ${job.position})…` : "Queued…", 0, job.steps);
+    } else {
+      show(`${STAGE_TEXT[job.stage] || "Working"}… (${job.step || 0}/${job.steps})`, Math.max(0, (job.step || 1) - 1), job.steps);
+    }
+    return false;
+  }
+
+  async function poll(id) {
+    while (current === id) {
+      try {
+        const res = await fetch(`/jobs/${id}`, { headers: { Accept: "application/json" } });
+        const job = await res.json();
+        if (!res.ok) { stop(job.error || "Lost track of the upload."); return; }
+        if (current !== id || render(job)) return;
+      } catch (err) {
+        // transient network error: keep polling
+      }
+      await new Promise(r => setTimeout(r, POLL_MS));
+    }
+  }
+
+  form.addEventListener("submit", async (e) => {
+    if (fallback) return;
+    e.preventDefault();
+    submitBtn.disabled = true;
+    show("Uploading…", 0, 1);
+    let res, job;
+    try {
+      res = await fetch("/jobs", { method: "POST", body: new FormData(form), headers: { Accept: "application/json" } });
+      job = await res.json();
+    } catch (err) {
+      plainSubmit();
+      return;
+    }
+    if (res.status === 429 || res.status === 400) { stop(job.error); return; }
+    if (!res.ok) { plainSubmit(); return; }
+    if (!job.id) { render(job); return; } // already built: cache hit
+    current = job.id;
+    cancelBtn.classList.remove("hidden");
+    render(job);
+    poll(job.id);
+  });
+
+  cancelBtn.addEventListener("click", async (e) => {
+    e.preventDefault();
+    if (!current) return;
+    cancelBtn.disabled = true;
+    try {
+      await fetch(`/jobs/${current}`, { method: "DELETE" });
+    } finally {
+      cancelBtn.disabled = false;
+    }
+  });
+})();
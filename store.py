@@ -0,0 +1,256 @@
+import json
+import os
+import re
+import sqlite3
+import time
+from contextlib import contextmanager
+from datetime import date
+from typing import Optional
+
+import pandas as pd
+
+try:
+    import orjson
+except ImportError:  # optional: stdlib json is slower per row
+    orjson = None
+
+from normalize import DERIVED_COLUMNS
+from report_cache import DATA_DIR, private_dir
+
+# ---------------- record store ----------------
+# Cleaned upload rows are kept in a SQLite file, so past terms can be queried
+# and their reports rebuilt without the original spreadsheets. Records are
+# clustered by upload and row through their integer key, so an upload is read
+# or dropped as one range, and indexed by student, module and week. The weekly workbook is
+# cumulative, so a full upload replaces the records of the same workbook
+# (same file name) in its term; other workbooks of the term are kept. Appended
+# weeks are chained to the upload they extend.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS uploads (
+    id        INTEGER PRIMARY KEY,
+    upload_id TEXT NOT NULL UNIQUE,   -- report id
+    term      TEXT NOT NULL,
+    parent    TEXT,                   -- upload this one appends to
+    filename  TEXT,
+    columns   TEXT NOT NULL,          -- JSON list of the cleaned columns
+    rows      INTEGER NOT NULL,
+    created   REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS uploads_term ON uploads (term, created);
+CREATE TABLE IF NOT EXISTS records (
+    id        INTEGER PRIMARY KEY,    -- uploads.id << 32 | row: an upload's rows sit together, in order
+    term      TEXT NOT NULL,
+    student   TEXT,                   -- canonical student number
+    module    TEXT,
+    week      TEXT,
+    qual      TEXT,                   -- canonical qualification
+    data      TEXT NOT NULL           -- JSON list of the cleaned cells, in uploads.columns order
+);
+CREATE INDEX IF NOT EXISTS records_student ON records (student, term);
+CREATE INDEX IF NOT EXISTS records_module ON records (term, module, week);
+CREATE INDEX IF NOT EXISTS records_week ON records (term, week);
+"""
+
+TERM_RE = re.compile(r"[A-Za-z0-9][A-Za-z0-9 _.-]{0,31}")
+HISTORY_ROWS = 500  # cleaned rows returned per student lookup
+SAVE_BATCH = 50_000  # rows turned into Python objects at a time while saving
+ROW_BITS = 32
+RECORD_FILTERS = ("student", "module", "week", "qual")  # indexed record columns a query may match on
+
+
+def _span(upload: int) -> tuple:
+    """records.id range of an upload's rows."""
+    return upload << ROW_BITS, ((upload + 1) << ROW_BITS) - 1
+
+
+def default_term(today: Optional[date] = None) -> str:
+    today = today or date.today()
+    return f"{today.year}-S{1 if today.month <= 6 else 2}"
+
+
+def valid_term(term: str) -> bool:
+    return bool(TERM_RE.fullmatch(term or ""))
+
+
+def _text(series: Optional[pd.Series], n: int) -> list:
+    if series is None:
+        return [None] * n
+    return series.astype(str).astype(object).where(series.notna(), None).tolist()
+
+
+def _dumps(row: list) -> str:
+    if orjson is not None:
+        return orjson.dumps(row, default=str).decode()
+    return json.dumps(row, default=str)
+
+
+class RecordStore:
+    def __init__(self, path: str):
+        self.path = path
+        # student records: nobody else may create or swap the database or its journal
+        private_dir(os.path.dirname(os.path.abspath(path)))
+        with self._db() as db:
+            db.execute("PRAGMA journal_mode=WAL")  # readers don't block the writer
+            db.executescript(SCHEMA)
+
+    @contextmanager
+    def _db(self):
+        # one short-lived connection per call: safe across threads and pool processes
+        db = sqlite3.connect(self.path, timeout=30)
+        try:
+            db.execute("PRAGMA synchronous=NORMAL")
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    # ---- writes ----
+    def save(self, upload_id: str, term: str, df: pd.DataFrame, cols: dict,
+             filename: str = "", parent: Optional[str] = None) -> None:
+        """Store the rows of a normalized frame (see normalize_frame) under upload_id."""
+        columns = [c for c in df.columns if c not in DERIVED_COLUMNS]
+        n = len(df)
+        with self._db() as db:
+            # take the write lock before looking for stale uploads, so two
+            # saves running side by side cannot both miss each other's rows
+            db.execute("BEGIN IMMEDIATE")
+            stale = db.execute("SELECT id FROM uploads WHERE upload_id = ?", (upload_id,)).fetchall()
+            if parent is None:
+                # a full (cumulative) upload supersedes the earlier uploads of
+                # the same workbook in its term, and the weeks appended to them;
+                # other workbooks of the term (other programmes) stay
+                stale += db.execute(
+                    "WITH RECURSIVE chain(id, upload_id) AS ("
+                    " SELECT id, upload_id FROM uploads WHERE term = ? AND filename = ? AND parent IS NULL"
+                    " UNION SELECT u.id, u.upload_id FROM uploads u JOIN chain c ON u.parent = c.upload_id)"
+                    " SELECT id FROM chain", (term, filename)).fetchall()
+            for (old,) in set(stale):
+                db.execute("DELETE FROM records WHERE id BETWEEN ? AND ?", _span(old))
+                db.execute("DELETE FROM uploads WHERE id = ?", (old,))
+            upload = db.execute(
+                "INSERT INTO uploads (upload_id, term, parent, filename, columns, rows, created) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (upload_id, term, parent, filename, json.dumps([str(c) for c in columns]), n, time.time()),
+            ).lastrowid
+            first = _span(upload)[0]
+            # in batches, so only SAVE_BATCH rows at a time exist as Python objects
+            for lo in range(0, n, SAVE_BATCH):
+                part = df.iloc[lo:lo + SAVE_BATCH]
+                m = len(part)
+                cells = part[columns].astype(object)
+                cells = cells.where(cells.notna(), None).values.tolist()
+                records = zip(
+                    range(first + lo, first + lo + m),
+                    [term] * m,
+                    _text(part.get("_sid"), m),
+                    _text(part[cols["module"]] if cols.get("module") else None, m),
+                    _text(part[cols["week"]] if cols.get("week") else None, m),
+                    _text(part.get("_qual"), m),
+                    map(_dumps, cells),
+                )
+                db.executemany("INSERT INTO records VALUES (?, ?, ?, ?, ?, ?, ?)", records)
+
+    # ---- reads ----
+    def term_of(self, upload_id: str) -> Optional[str]:
+        with self._db() as db:
+            row = db.execute("SELECT term FROM uploads WHERE upload_id = ?", (upload_id,)).fetchone()
+        return row[0] if row else None
+
+    def _chain(self, db, upload_id: str) -> Optional[list]:
+        """(uploads.id, columns) of an upload and of every upload it appends to, oldest first."""
+        chain, uid = [], upload_id
+        while uid is not None:
+            row = db.execute("SELECT id, parent, columns FROM uploads WHERE upload_id = ?", (uid,)).fetchone()
+            if row is None or len(chain) > 1000:
+                return None
+            chain.append((row[0], json.loads(row[2])))
+            uid = row[1]
+        return chain[::-1]
+
+    def load_frame(self, upload_id: str) -> Optional[pd.DataFrame]:
+        """Cleaned rows of an upload and of every upload it appends to, oldest first."""
+        with self._db() as db:
+            chain = self._chain(db, upload_id)
+            if chain is None:
+                return None
+            data = []
+            for upload, _ in chain:
+                cur = db.execute("SELECT data FROM records WHERE id BETWEEN ? AND ? ORDER BY id", _span(upload))
+                data.extend(json.loads(d) for (d,) in cur)
+        # same dtype as ingest's readers, so a rebuilt report matches the original
+        return pd.DataFrame(data, columns=chain[0][1], dtype=str)
+
+    def records(self, upload_id: str, filters: Optional[dict] = None) -> Optional[tuple]:
+        """(columns, rows) of an upload chain's records matching filters, oldest first.
+
+        filters maps RECORD_FILTERS to values. rows is a generator reading
+        from the database as it is consumed, so a caller streaming it holds
+        one row at a time.
+        """
+        with self._db() as db:
+            chain = self._chain(db, upload_id)
+        if chain is None:
+            return None
+        filters = {f: filters[f] for f in RECORD_FILTERS if (filters or {}).get(f)}
+        where = "".join(f" AND {f} = ?" for f in filters)
+        # appended uploads may bring columns of their own: rows line up by name
+        columns = list(dict.fromkeys(c for _, cols in chain for c in cols))
+
+        def rows():
+            with self._db() as db:
+                for upload, cols in chain:
+                    at = None if cols == columns else [columns.index(c) for c in cols]
+                    cur = db.execute(f"SELECT data FROM records WHERE id BETWEEN ? AND ?{where} ORDER BY id",
+                                     (*_span(upload), *filters.values()))
+                    for (data,) in cur:
+                        cells = json.loads(data)
+                        if at is not None:
+                            row = [None] * len(columns)
+                            for i, v in zip(at, cells):
+                                row[i] = v
+                            cells = row
+                        yield cells
+
+        return columns, rows()
+
+    def terms(self) -> list:
+        """Stored terms with their latest upload (the report to show for the term)."""
+        with self._db() as db:
+            rows = db.execute(
+                "SELECT term, upload_id, filename, created, "
+                "(SELECT COUNT(*) FROM uploads u2 WHERE u2.term = u.term), "
+                "(SELECT SUM(rows) FROM uploads u2 WHERE u2.term = u.term) "
+                "FROM uploads u WHERE created = (SELECT MAX(created) FROM uploads u2 WHERE u2.term = u.term) "
+                "ORDER BY term").fetchall()
+        return [{"term": t, "report_id": uid, "filename": fn, "updated": created, "uploads": n, "records": total}
+                for t, uid, fn, created, n, total in rows]
+
+    def student_history(self, sid: str, term: Optional[str] = None, limit: int = HISTORY_ROWS) -> list:
+        """A student's records in every stored term (or one), via the student index."""
+        sql = f"SELECT term, id >> {ROW_BITS}, module, week, data FROM records WHERE student = ?"
+        args = [sid]
+        if term:
+            sql += " AND term = ?"
+            args.append(term)
+        sql += " ORDER BY term, id"
+        out, columns = {}, {}
+        with self._db() as db:
+            for t, upload, module, week, data in db.execute(sql, args):
+                entry = out.setdefault(t, {"term": t, "records": 0, "modules": {}, "weeks": {}, "rows": []})
+                entry["records"] += 1
+                if module is not None:
+                    entry["modules"][module] = entry["modules"].get(module, 0) + 1
+                if week is not None:
+                    entry["weeks"][week] = entry["weeks"].get(week, 0) + 1
+                if len(entry["rows"]) < limit:
+                    if upload not in columns:
+                        row = db.execute("SELECT columns FROM uploads WHERE id = ?", (upload,)).fetchone()
+                        columns[upload] = json.loads(row[0]) if row else []
+                    entry["rows"].append(dict(zip(columns[upload], json.loads(data))))
+        return list(out.values())
+
+
+def store_from_env() -> Optional[RecordStore]:
+    path = os.environ.get("REPORT_STORE_PATH", os.path.join(DATA_DIR, "records.sqlite3"))
+    return RecordStore(path) if path else None
@@ -0,0 +1,14 @@
+import os
+import sys
+import tempfile
+import warnings
+
+# the app reads its settings from the environment on import: give the tests
+# a private cache, record store and job directory
+_work = tempfile.mkdtemp(prefix="soit-tests-")
+os.environ.update(REPORT_CACHE_DIR=os.path.join(_work, "cache"), REPORT_CACHE_ITEMS="0",
+                  REPORT_STORE_PATH=os.path.join(_work, "records.sqlite3"),
+                  REPORT_JOB_DIR=os.path.join(_work, "jobs"))
+os.environ.pop("REPORT_RULES", None)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+warnings.filterwarnings("ignore", category=UserWarning)  # openpyxl's default-style warning
@@ -0,0 +1,27 @@
+from io import BytesIO
+
+import pytest
+
+import app
+from ingest import read_upload
+
+# uploads the report must build from even when columns are missing or unknown
+LAYOUTS = {
+    "no student column": b"Module Code,Week,Reason for risk\nMOD1,Week 1,Absent\nMOD2,Week 2,Poor marks\n",
+    "no known column": b"a,b\n1,2\n",
+    "student column only": b"Student Number\n123\n123.0\n",
+}
+
+
+@pytest.mark.parametrize("content", LAYOUTS.values(), ids=LAYOUTS.keys())
+def test_build_report(content):
+    report = app.build_report(read_upload(content, "upload.csv"))
+    assert report["cleaning_stats"]["rows_final"] >= 1
+
+
+@pytest.mark.parametrize("content", LAYOUTS.values(), ids=LAYOUTS.keys())
+def test_upload_page(content):
+    resp = app.app.test_client().post("/upload", data={"file": (BytesIO(content), "upload.csv"), "term": "tests"},
+                                      content_type="multipart/form-data")
+    assert resp.status_code == 200
+    assert b"Failed to read file" not in resp.data
@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import app
+from benchmarks.synth import to_bytes, workbook
+from cube import FilterCube
+from ingest import read_upload
+from report_state import merge
+
+
+def _plain(value):
+    """Report value with arrays and the filter cube as plain lists and dicts."""
+    if isinstance(value, FilterCube):
+        value = vars(value)
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, dict):
+        return {k: _plain(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_plain(v) for v in value]
+    return value
+
+
+def _state(df):
+    return app.build_state(read_upload(to_bytes(df, "csv"), "upload.csv"))
+
+
+def _weeks(df, lo, hi):
+    n = df["Week"].str.extract(r"(\d+)", expand=False).astype(float)
+    return df[(n >= lo) & (n <= hi)]
+
+
+# how a cumulative workbook is split into a stored upload and the rows appended to it
+SPLITS = {
+    "later weeks": lambda df: (_weeks(df, 1, 12), _weeks(df, 13, 99)),
+    "one more week": lambda df: (_weeks(df, 1, 19), _weeks(df, 20, 99)),
+    "rows in half": lambda df: (df.iloc[:len(df) // 2], df.iloc[len(df) // 2:]),
+}
+
+
+@pytest.mark.parametrize("split", SPLITS.values(), ids=SPLITS.keys())
+def test_merge_matches_rebuild(split):
+    df = workbook(4000, seed=11)
+    df = df[df["Week"] != ""]  # rows without a week belong to no split by week
+    a, b = split(df)
+    merged = merge(_state(a), _state(b))
+    full = _state(pd.concat([a, b]))  # the cumulative workbook: a's rows, then b's
+
+    assert merged.totals == full.totals
+    assert merged.cleaning_stats == full.cleaning_stats
+    assert _plain(app.assemble_report(merged)) == _plain(app.assemble_report(full))
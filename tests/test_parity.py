@@ -0,0 +1,70 @@
+from io import BytesIO
+
+import pandas as pd
+import pytest
+
+import app
+import reference
+from benchmarks.synth import to_bytes, workbook
+from ingest import read_upload
+from ranking import TOP_K
+
+# build_report must give the reference's output (tests/reference.py) key for
+# key, except where a request changed it on purpose:
+# - ids differing only in formatting ("123" / "123.0") are merged (user-004),
+#   so the workbooks here write ids one way;
+# - top lists keep TOP_K rows, ties broken by student id (user-005);
+# - sample rows hold the cleaned report columns only (user-002, user-014);
+# - cleaning stats also list the sheets a workbook's data was not read from
+#   (user-015).
+CHANGED = {"sample_rows", "global_top_students_att", "module_top_students_att", "cleaning_stats"}
+
+# the reference runs as written for an older pandas
+pytestmark = pytest.mark.filterwarnings("ignore::UserWarning", "ignore::FutureWarning",
+                                        "ignore::pandas.errors.ChainedAssignmentError")
+
+
+def _drop(*columns):
+    return lambda df: df.drop(columns=list(columns))
+
+
+VARIANTS = {
+    "all columns": lambda df: df,
+    "no risk level": _drop("Risk Level"),
+    "no week": _drop("Week"),
+    "no intervention": _drop("Intervention"),  # (the reference cannot build without Student Name)
+    "no qualification": _drop("Qualification"),
+    "no reason": _drop("Reason"),
+    "resolved column": lambda df: df.drop(columns=["Intervention"]).assign(
+        Resolved=df["Intervention"].map(lambda v: "Yes" if v else "no")),
+    "risk in reason header": lambda df: df.drop(columns=["Risk Level"]).rename(columns={"Reason": "Reason for risk"}),
+}
+
+
+def _ranked(rows):
+    return sorted(rows, key=lambda r: (-r["count"], -r["rate"], r["id"]))
+
+
+@pytest.mark.parametrize("fmt", ["csv", "xlsx"])
+@pytest.mark.parametrize("variant", VARIANTS.values(), ids=VARIANTS.keys())
+def test_matches_reference(variant, fmt):
+    df = variant(workbook(800 if fmt == "xlsx" else 3000, messy=0.0, seed=7))
+    content = to_bytes(df, fmt)
+    raw = pd.read_csv(BytesIO(content), dtype=object) if fmt == "csv" else pd.read_excel(BytesIO(content))
+    expected = reference.build_report(raw)
+    report = app.build_report(read_upload(content, "upload." + fmt))
+
+    for key, value in expected.items():
+        if key not in CHANGED:
+            assert report[key] == value, key
+
+    stats = dict(report["cleaning_stats"])
+    assert stats.pop("skipped_sheets") == []
+    assert stats == expected["cleaning_stats"]
+
+    assert report["ranking"]["global"] == _ranked(expected["global_top_students_att"])
+    assert report["global_top_students_att"] == report["ranking"]["global"][:TOP_K]
+    assert list(report["ranking"]["modules"]) == list(expected["module_top_students_att"])
+    for module, rows in expected["module_top_students_att"].items():
+        assert report["ranking"]["modules"][module] == _ranked(rows), module
+        assert report["module_top_students_att"][module] == _ranked(rows)[:TOP_K], module
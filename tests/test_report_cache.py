@@ -0,0 +1,32 @@
+import os
+
+import pytest
+
+from report_cache import ReportCache, private_dir
+
+
+def test_new_directory_is_private(tmp_path):
+    path = private_dir(str(tmp_path / "cache"))
+    assert os.stat(path).st_mode & 0o777 == 0o700
+
+
+def test_shared_directory_is_refused(tmp_path):
+    shared = tmp_path / "shared"
+    shared.mkdir()
+    shared.chmod(0o1777)  # like /tmp: anyone could have planted a pickle
+    with pytest.raises(PermissionError):
+        ReportCache(str(shared))
+
+
+@pytest.mark.skipif(not hasattr(os, "geteuid") or os.geteuid() != 0, reason="needs root to chown")
+def test_foreign_directory_is_refused(tmp_path):
+    foreign = tmp_path / "foreign"
+    foreign.mkdir(mode=0o700)
+    os.chown(foreign, 12345, 12345)
+    with pytest.raises(PermissionError):
+        ReportCache(str(foreign))
+
+
+def test_missing_parents_are_private(tmp_path):
+    private_dir(str(tmp_path / "a" / "b"))
+    assert os.stat(tmp_path / "a").st_mode & 0o777 == 0o700
@@ -0,0 +1,53 @@
+from io import BytesIO
+
+import pandas as pd
+
+import app
+from ingest import read_upload
+
+COLUMNS = ["Student Number", "Module Code", "Week", "Reason", "Risk Level", "Intervention"]
+WEEK1 = [["1001", "MOD1", "Week 1", "Absent", "High", "Email sent"],
+         [None] * 6,  # blank row
+         ["1002", "MOD2", "Week 1", "Poor marks", "Low", None]]
+WEEK2 = [["1001", "MOD1", "Week 2", "No show", "High", None],
+         [None] * 6,
+         ["1003", "MOD1", "Week 2", "Absent", "Moderate", "Meeting booked"]]
+
+
+def _xlsx(sheets: dict) -> bytes:
+    buf = BytesIO()
+    with pd.ExcelWriter(buf, engine="openpyxl") as xw:
+        for name, df in sheets.items():
+            df.to_excel(xw, sheet_name=name, index=False)
+    return buf.getvalue()
+
+
+def _frame(rows):
+    return pd.DataFrame(rows, columns=COLUMNS)
+
+
+def test_blank_rows_dropped_across_sheets():
+    one = app.build_report(read_upload(_xlsx({"All": _frame(WEEK1 + WEEK2)}), "upload.xlsx"))
+    many = app.build_report(read_upload(_xlsx({"Week 1": _frame(WEEK1), "Week 2": _frame(WEEK2)}), "upload.xlsx"))
+    assert one["cleaning_stats"]["rows_final"] == 4
+    assert many["cleaning_stats"]["rows_final"] == 4
+    for key in ("total_records", "risk_counts", "resolved_counts", "by_reason", "by_module"):
+        assert many[key] == one[key], key
+
+
+def test_notes_sheet_does_not_pick_the_layout():
+    cover = pd.DataFrame({"Module": ["Read me first"]})  # resolves the module role only
+    content = _xlsx({"Cover": cover, "Week 1": _frame(WEEK1), "Week 2": _frame(WEEK2), "Notes": pd.DataFrame()})
+    df = read_upload(content, "upload.xlsx")
+    assert list(df["Sheet"].cat.categories) == ["Week 1", "Week 2"]
+    report = app.build_report(df)
+    assert report["cleaning_stats"]["rows_final"] == 4
+    assert report["cleaning_stats"]["skipped_sheets"] == ["Cover", "Notes"]
+
+
+def test_skipped_sheets_on_the_page():
+    content = _xlsx({"Cover": pd.DataFrame({"Module": ["Read me first"]}), "Week 1": _frame(WEEK1)})
+    resp = app.app.test_client().post("/upload", data={"file": (BytesIO(content), "upload.xlsx"), "term": "tests"},
+                                      content_type="multipart/form-data")
+    assert resp.status_code == 200
+    assert b"Sheets left out" in resp.data and b"Cover" in resp.data
@@ -0,0 +1,139 @@
+import gzip
+import json
+
+try:
+    import orjson
+except ImportError:  # optional: stdlib json is much slower on large arrays
+    orjson = None
+try:
+    import brotli
+except ImportError:  # optional: gzip is always available
+    brotli = None
+
+# ---------------- compact wire format ----------------
+# The per-student maps repeat every student id, module and week name once per
+# entry. For bulk transfer they are sent as dictionary tables (students,
+# modules, weeks, risk labels) plus CSR integer arrays: the entries of student
+# i are col[indptr[i]:indptr[i+1]] / val[...], with col indexing the tables.
+# Two-level maps flatten their key pair into one col (outer * len(inner) + inner).
+# Entries keep the order of the source dicts, so decoding (static/api.js)
+# gives back exactly what the per-student JSON endpoint returns.
+
+WIRE_FORMAT = "soit-columnar/1"
+ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+MIN_COMPRESS = 1024  # smaller bodies are not worth compressing
+
+
+class _Table:
+    """Value -> code, seeded with a known order and extended on first sight."""
+
+    def __init__(self, values=()):
+        self.values = []
+        self.codes = {}
+        for v in values:
+            self.code(v)
+
+    def code(self, v) -> int:
+        c = self.codes.get(v)
+        if c is None:
+            c = self.codes[v] = len(self.values)
+            self.values.append(v)
+        return c
+
+
+def _csr(rows, extra: str = None) -> dict:
+    """rows yields, per student, an iterable of (col, val) or (col, val, extra)."""
+    indptr, col, val, more = [0], [], [], []
+    for entries in rows:
+        for e in entries:
+            col.append(e[0])
+            val.append(e[1])
+            if extra:
+                more.append(e[2])
+        indptr.append(len(col))
+    out = {"indptr": indptr, "col": col, "val": val}
+    if extra:
+        out[extra] = more
+    return out
+
+
+def encode_students(report: dict) -> dict:
+    """Per-student maps of a report in the columnar wire format."""
+    lookup = report.get("student_lookup") or []
+    ids = [s["id"] for s in lookup]
+    modules = _Table(report.get("modules") or [])
+    weeks = _Table(report.get("weeks") or [])
+    quals = _Table([""])
+
+    # collect every key first: two-level cols need the final table sizes
+    risks = _Table()
+    for per_mod in (report.get("ps_risk_module_max") or {}).values():
+        for r in per_mod.values():
+            risks.code(r)
+    for per_week in (report.get("ps_week_risk_counts") or {}).values():
+        for w, per_risk in per_week.items():
+            weeks.code(w)
+            for r in per_risk:
+                risks.code(r)
+    for per_mod in (report.get("ps_week_module_att") or {}).values():
+        for m, per_week in per_mod.items():
+            modules.code(m)
+            for w in per_week:
+                weeks.code(w)
+    for per_week in (report.get("ps_weeks_att") or {}).values():
+        for w in per_week:
+            weeks.code(w)
+    for key in ("ps_modules_att", "ps_risk_module_max"):
+        for per_mod in (report.get(key) or {}).values():
+            for m in per_mod:
+                modules.code(m)
+    for rows in (report.get("student_module_summary") or {}).values():
+        for r in rows:
+            modules.code(r["module"])
+    n_weeks, n_risks = len(weeks.values), len(risks.values)
+
+    def rows(key, default):
+        data = report.get(key) or {}
+        return (data.get(s, default) for s in ids)
+
+    m, w, r = modules.codes, weeks.codes, risks.codes
+    fields = {
+        "modules_att": _csr(((m[k], v) for k, v in d.items()) for d in rows("ps_modules_att", {})),
+        "weeks_att": _csr(((w[k], v) for k, v in d.items()) for d in rows("ps_weeks_att", {})),
+        "risk_module_max": _csr(((m[k], r[v]) for k, v in d.items()) for d in rows("ps_risk_module_max", {})),
+        "week_risk_counts": _csr(
+            ((w[wk] * n_risks + r[rk], v) for wk, per_risk in d.items() for rk, v in per_risk.items())
+            for d in rows("ps_week_risk_counts", {})),
+        "week_module_att": _csr(
+            ((m[mk] * n_weeks + w[wk], v) for mk, per_week in d.items() for wk, v in per_week.items())
+            for d in rows("ps_week_module_att", {})),
+        "module_summary": _csr((
+            ((m[x["module"]], x["total_absences"], x["rate"]) for x in d)
+            for d in rows("student_module_summary", [])), extra="rate"),
+    }
+    return {
+        "format": WIRE_FORMAT,
+        # labels are rebuilt client-side as "id — name — [qual]", like student_lookup
+        "students": {
+            "id": ids,
+            "name": [s["name"] for s in lookup],
+            "qual": [quals.code(s["qual"]) for s in lookup],
+        },
+        "tables": {"modules": modules.values, "weeks": weeks.values,
+                   "risks": risks.values, "quals": quals.values},
+        "fields": fields,
+    }
+
+
+def dumps(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=5)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=6, mtime=0)
+    return body